@@ -0,0 +1,139 @@
+# Disease Model Benchmarks
+# This file compares the Keras and TFLite disease model backends on the same
+# labeled images: accuracy (and its delta to Keras), agreement with the
+# Keras predictions, p50/p99 single-image latency and peak process RSS.
+# It also measures training input pipeline throughput in images/sec.
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import resource
+import time
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from disease_detection import (
+    BACKENDS, list_images, load_class_names, make_generators, make_datasets, make_augmentation
+)
+
+def _run_backend(backend, paths, repeats):
+    """
+    Score every image one at a time with one backend, in a fresh process
+
+    Images are decoded before timing, so latency covers inference only.
+    Returns the predicted classes, per-call latencies and peak RSS in MB.
+    """
+    from disease_detection import load_serving_function, preprocess_image
+
+    _, serve = load_serving_function(backend)
+    images = [np.expand_dims(preprocess_image(path), axis=0) for path in paths]
+    serve(images[0])
+
+    predicted = []
+    latencies = []
+    for _ in range(repeats):
+        predicted = []
+        for image in images:
+            started = time.perf_counter()
+            probabilities = np.asarray(serve(image))
+            latencies.append((time.perf_counter() - started) * 1000)
+            predicted.append(int(np.argmax(probabilities)))
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return np.array(predicted), np.array(latencies), peak_rss
+
+def bench_backends(data_dir, backends, n, repeats=1, seed=0):
+    """
+    Benchmark each backend on the same random sample of n labeled images
+    """
+    images = list_images(data_dir)
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(images), size=min(n, len(images)), replace=False)
+    paths = [images[index][0] for index in sample]
+
+    class_index = {name: index for index, name in enumerate(load_class_names())}
+    labels = np.array([class_index.get(images[index][1], -1) for index in sample])
+    print(f"{len(paths)} images from {data_dir}")
+
+    results = {}
+    for backend in backends:
+        # A fresh process per backend keeps the RSS numbers separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[backend] = pool.submit(_run_backend, backend, paths, repeats).result()
+
+    reference = results.get('keras')
+    for backend, (predicted, latencies, peak_rss) in results.items():
+        accuracy = np.mean(predicted == labels)
+        line = (f"{backend:<16} accuracy={accuracy:.4f} "
+                f"p50={np.percentile(latencies, 50):8.3f}ms "
+                f"p99={np.percentile(latencies, 99):8.3f}ms "
+                f"rss={peak_rss:8.1f}MB")
+        if reference is not None and backend != 'keras':
+            line += (f" accuracy_delta={accuracy - np.mean(reference[0] == labels):+.4f}"
+                     f" agreement={np.mean(predicted == reference[0]):.4f}")
+        print(line)
+    return results
+
+def time_batches(batches, n_batches):
+    """
+    Pull n_batches from an iterator and return images per second
+    """
+    next(batches)
+    images = 0
+    started = time.perf_counter()
+    for _ in range(n_batches):
+        images += len(next(batches)[0])
+    return images / (time.perf_counter() - started)
+
+def time_pass(dataset):
+    """
+    Iterate a finite dataset once and return images per second
+    """
+    images = 0
+    started = time.perf_counter()
+    for batch, _ in dataset:
+        images += len(batch)
+    return images / (time.perf_counter() - started)
+
+def bench_input_pipeline(data_dir, n_batches):
+    """
+    Compare ImageDataGenerator with the tf.data pipeline, training and
+    validation, without a model in the loop
+    """
+    train_generator, validation_generator = make_generators(data_dir)
+    train_dataset, validation_dataset, _ = make_datasets(data_dir, augmentation=make_augmentation())
+
+    results = {
+        'generator train': time_batches(train_generator, n_batches),
+        'tf.data train': time_batches(iter(train_dataset.repeat()), n_batches),
+        'generator validation': time_batches(validation_generator, n_batches)
+    }
+    # The first pass fills the validation cache, later passes read from it
+    for epoch in ['epoch 1', 'cached']:
+        results[f'tf.data validation ({epoch})'] = time_pass(validation_dataset)
+
+    for name, rate in results.items():
+        print(f"{name:<32} {rate:10.1f} images/sec")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark disease model inference backends and input pipelines")
+    parser.add_argument('data_dir', help="labeled image directory with one folder per class")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS,
+                        help="backends to compare")
+    parser.add_argument('--n', type=int, default=500, help="number of images to score")
+    parser.add_argument('--repeats', type=int, default=1, help="passes over the images when timing")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--input-pipeline', action='store_true',
+                        help="benchmark training input pipelines instead of inference backends")
+    parser.add_argument('--batches', type=int, default=50, help="batches timed per input pipeline")
+    args = parser.parse_args()
+
+    if args.input_pipeline:
+        bench_input_pipeline(args.data_dir, args.batches)
+    else:
+        bench_backends(args.data_dir, args.backends, args.n, args.repeats, args.seed)
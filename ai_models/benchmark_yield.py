@@ -0,0 +1,129 @@
+# Yield Model Benchmarks
+# This file measures the latency of the yield prediction paths and checks
+# that the optimized paths return the same values as the original code.
+
+import argparse
+import time
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from yield_predictor import registry, predict_yield, train_model
+
+CROPS = ['wheat', 'rice', 'corn', 'soybeans', 'cotton']
+
+def random_inputs(n, seed=0):
+    """
+    Generate n random prediction inputs in the training ranges
+    """
+    rng = np.random.default_rng(seed)
+    return [{
+        'crop': CROPS[rng.integers(len(CROPS))],
+        'soil_quality': float(rng.uniform(1, 10)),
+        'rainfall': float(rng.uniform(500, 2000)),
+        'temperature': float(rng.uniform(15, 40)),
+        'area': float(rng.uniform(1, 10)),
+        'fertilizer': float(rng.uniform(50, 200))
+    } for _ in range(n)]
+
+def legacy_predict_yield(crop, soil_quality, rainfall, temperature, area, fertilizer):
+    """
+    The original pandas-based single-row prediction path (model already loaded)
+
+    Missing numeric features are filled with their training mean, matching
+    the imputation the feature layout applies, and the crop's feature store
+    values are joined in.
+    """
+    state = registry.get()
+    input_data = pd.DataFrame({
+        'soil_quality': [soil_quality],
+        'rainfall': [rainfall],
+        'temperature': [temperature],
+        'area': [area],
+        'fertilizer': [fertilizer]
+    })
+    input_data[f'crop_{crop}'] = 1
+    if state['layout'].store is not None:
+        for name, value in state['layout'].store.lookup({'crop': crop}).items():
+            input_data[name] = value
+    input_data = input_data.reindex(columns=state['feature_names'])
+    input_data = input_data.fillna(pd.Series(state['scaler'].mean_, index=state['feature_names'])[
+        state['layout'].numeric_names]).fillna(0)
+    input_scaled = state['scaler'].transform(input_data)
+    return state['model'].predict(input_scaled)[0]
+
+def time_calls(fn, inputs):
+    """
+    Time fn(**row) for each row, returning per-call latencies in milliseconds
+    """
+    latencies = []
+    for row in inputs:
+        started = time.perf_counter()
+        fn(**row)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(latencies)
+
+def report(name, latencies):
+    print(f"{name:<24} p50={np.percentile(latencies, 50):8.3f}ms "
+          f"p99={np.percentile(latencies, 99):8.3f}ms "
+          f"mean={latencies.mean():8.3f}ms")
+
+def bench_forest_engine(batch_sizes, repeats=20, seed=0):
+    """
+    Compare sklearn's forest predict with the flattened array engine
+    """
+    state = registry.get()
+    model, engine = state['model'], state['engine']
+    rng = np.random.default_rng(seed)
+
+    for batch_size in batch_sizes:
+        X = rng.normal(size=(batch_size, len(state['feature_names'])))
+        max_diff = np.max(np.abs(model.predict(X) - engine.predict(X)))
+
+        timings = {}
+        for name, fn in [('sklearn', model.predict), ('engine', engine.predict)]:
+            fn(X)
+            latencies = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                fn(X)
+                latencies.append((time.perf_counter() - started) * 1000)
+            timings[name] = np.median(latencies)
+
+        print(f"batch={batch_size:<6} sklearn={timings['sklearn']:9.3f}ms "
+              f"engine={timings['engine']:9.3f}ms "
+              f"speedup={timings['sklearn'] / timings['engine']:6.1f}x max_abs_diff={max_diff:.2e}")
+
+def bench_single_row(n):
+    """
+    Compare the legacy pandas path with the precompiled feature layout
+    """
+    inputs = random_inputs(n)
+
+    # Outputs must be bit-for-bit identical
+    mismatches = sum(legacy_predict_yield(**row) != predict_yield(**row) for row in inputs)
+    print(f"single-row outputs: {n - mismatches}/{n} identical")
+
+    # Warm up both paths before timing
+    time_calls(legacy_predict_yield, inputs[:20])
+    time_calls(predict_yield, inputs[:20])
+
+    report('legacy pandas', time_calls(legacy_predict_yield, inputs))
+    report('layout + engine', time_calls(predict_yield, inputs))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark yield prediction latency")
+    parser.add_argument('--n', type=int, default=500, help="number of requests to time")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 4096],
+                        help="batch sizes for the forest engine comparison")
+    args = parser.parse_args()
+
+    # Load (or train) the model before timing anything
+    if registry.get() is None:
+        train_model()
+        registry.get()
+    bench_single_row(args.n)
+    bench_forest_engine(args.batch_sizes)
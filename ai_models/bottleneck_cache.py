@@ -0,0 +1,128 @@
+# Bottleneck Feature Cache
+# This file stores the pooled outputs of a frozen backbone for every image
+# in a memory-mapped .npy file, keyed by file path and modification time,
+# so retraining a classifier head never runs the backbone on unchanged
+# images again.
+
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# Rows allocated when the feature file is first created
+INITIAL_CAPACITY = 1024
+
+# Batches written between index checkpoints during extraction
+CHECKPOINT_EVERY = 50
+
+class BottleneckCache:
+    """
+    Feature rows for image files, stored in features.npy with an
+    index.json mapping each path to its row, mtime and size
+
+    key identifies the backbone (and its input preprocessing); a cache
+    written under a different key is discarded. An image whose mtime or
+    size changed gets its row recomputed in place; rows of deleted images
+    are simply never read.
+    """
+
+    def __init__(self, directory, dim, key):
+        self.directory = directory
+        self.dim = dim
+        self.key = key
+        self.index_path = os.path.join(directory, 'index.json')
+        self.features_path = os.path.join(directory, 'features.npy')
+        self.entries = {}
+        self.n_rows = 0
+        self.features = None
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path) and os.path.exists(self.features_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('key') == key and index.get('dim') == dim:
+                self.entries = index['entries']
+                self.n_rows = index['n_rows']
+                self.features = open_memmap(self.features_path, mode='r+')
+
+    def _ensure_capacity(self, n_rows):
+        # Grow the feature file by doubling, copying the rows in use
+        capacity = 0 if self.features is None else len(self.features)
+        if n_rows <= capacity:
+            return
+
+        tmp_path = self.features_path + '.tmp'
+        grown = open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                            shape=(max(n_rows, 2 * capacity, INITIAL_CAPACITY), self.dim))
+        if self.features is not None:
+            grown[:self.n_rows] = self.features[:self.n_rows]
+        grown.flush()
+        del grown
+        self.features = None
+        os.replace(tmp_path, self.features_path)
+        self.features = open_memmap(self.features_path, mode='r+')
+
+    def save(self):
+        """
+        Flush the feature rows, then atomically replace the index
+        """
+        if self.features is not None:
+            self.features.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': self.key, 'dim': self.dim, 'n_rows': self.n_rows, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def stale(self, paths):
+        """
+        Return the paths that have no row or whose file changed since
+        """
+        stale = []
+        for path in paths:
+            stat = os.stat(path)
+            entry = self.entries.get(path)
+            if entry is None or entry[1:] != [stat.st_mtime_ns, stat.st_size]:
+                stale.append(path)
+        return stale
+
+    def features_for(self, paths, extract):
+        """
+        Return the (len(paths), dim) feature matrix for paths, computing
+        only stale rows
+
+        extract(paths) must yield feature batches for the given paths in
+        order. Rows are written as batches arrive and the index is only
+        updated after its rows are on disk, so an interrupted run resumes
+        where it stopped. Returns the features and the number computed.
+        """
+        if not paths:
+            return np.zeros((0, self.dim), dtype=np.float32), 0
+
+        stale = self.stale(paths)
+        if stale:
+            # Changed images reuse their row; new images are appended
+            rows = []
+            for path in stale:
+                if path in self.entries:
+                    rows.append(self.entries[path][0])
+                else:
+                    rows.append(self.n_rows)
+                    self.n_rows += 1
+            self._ensure_capacity(self.n_rows)
+
+            done = 0
+            for batch_number, batch in enumerate(extract(stale), start=1):
+                batch_rows = rows[done:done + len(batch)]
+                self.features[batch_rows] = batch
+                for path, row in zip(stale[done:done + len(batch)], batch_rows):
+                    stat = os.stat(path)
+                    self.entries[path] = [row, stat.st_mtime_ns, stat.st_size]
+                done += len(batch)
+                if batch_number % CHECKPOINT_EVERY == 0:
+                    self.save()
+            if done != len(stale):
+                raise ValueError(f"extract returned {done} feature rows for {len(stale)} images")
+            self.save()
+
+        return np.asarray(self.features[[self.entries[path][0] for path in paths]]), len(stale)
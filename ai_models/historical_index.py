@@ -0,0 +1,429 @@
+# Historical Yield Index
+# This file keeps in-memory rollups (count, mean, min, max) of recorded
+# yields per crop, region, season and period. They are built once from a
+# CSV and updated from rows appended to it, so lookups never scan raw data.
+
+from itertools import product
+import threading
+import time
+import io
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; history writers then only serialize per process
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+# Crop yield records, in the crop-yield-data.csv schema
+DATA_PATH = os.environ.get(
+    'YIELD_DATA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crop-yield-data.csv')
+)
+
+# Yields served by /predict, appended in the same schema
+PREDICTION_HISTORY_PATH = os.environ.get('YIELD_PREDICTION_HISTORY_PATH', 'model/prediction_history.csv')
+
+# Size at which the prediction history is rotated to <path>.1
+HISTORY_MAX_BYTES = int(os.environ.get('YIELD_PREDICTION_HISTORY_MAX_BYTES', 64 * 1024 * 1024))
+
+# Served predictions buffered before an early flush, and seconds between flushes
+HISTORY_FLUSH_ROWS = 1000
+HISTORY_FLUSH_INTERVAL = 1.0
+
+# Rows held while the history writer falls behind; beyond this they are dropped
+HISTORY_MAX_PENDING = 100_000
+
+HISTORY_COLUMNS = ['crop', 'temperature', 'rainfall', 'soilType', 'season', 'expectedYield', 'region', 'date']
+
+# Seconds between checks of the CSV for appended rows
+REFRESH_INTERVAL = float(os.environ.get('YIELD_HISTORY_REFRESH_INTERVAL', 2.0))
+
+# Bytes parsed per pass when reading the CSV
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Dimensions every rollup is keyed by
+KEY_COLUMNS = ['crop', 'region', 'season']
+
+# Key value matching every crop, region or season
+ALL = '*'
+
+# Period length of each rollup and how its dates are truncated
+GRANULARITIES = {'month': 'M', 'day': 'D'}
+
+# Statistics kept per period of a rollup
+STAT_NAMES = ['count', 'sum', 'min', 'max']
+
+# How each statistic combines across finer rollups
+STAT_AGGREGATES = {'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'}
+
+def _normalize(value):
+    # Lookup key for a requested crop, region or season
+    return ALL if value is None else str(value).strip().lower() or ALL
+
+def _normalize_column(series):
+    # Normalize each distinct value once rather than every row. Missing
+    # values get their own '' key so they are never counted under ALL twice
+    codes, uniques = pd.factorize(series)
+    normalized = np.array([str(value).strip().lower() for value in uniques] + [''], dtype=object)
+    return pd.Categorical(normalized[codes])
+
+class HistoricalIndex:
+    """
+    Thread-safe rollups of yield records, refreshed from the tail of a CSV
+
+    Every record is added under each combination of its crop, region and
+    season with the ALL wildcard, so any lookup is a single dict read.
+    """
+
+    def __init__(self, path=DATA_PATH, refresh_interval=REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._rollups = {}
+        self._series = {}
+        self._header = None
+        self._offset = 0
+        self._last_size = None
+        self._inode = None
+        self._checked_at = 0.0
+
+    def _start_segment(self):
+        # Read the next file from its header; the rollups are kept
+        self._header = None
+        self._offset = 0
+        self._last_size = None
+        self._inode = None
+
+    def _reset(self):
+        self._rollups = {}
+        self._series = {}
+        self._start_segment()
+
+    def refresh(self):
+        """
+        Fold in rows appended to the CSV since the last refresh
+
+        Complete lines are consumed right away. A final line without a
+        newline is consumed once the file looks settled: its mtime is at
+        least refresh_interval old, or its size has not changed since the
+        previous check. A file rotated to <path>.1 (see HistoryWriter) is
+        read to its end there and the new file is added as a further
+        segment; the first refresh also folds in an existing <path>.1. A
+        file that was otherwise replaced or shrank rebuilds the rollups
+        from scratch. Returns the rows added.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            added = 0
+            if self._inode is None and self._header is None and not self._rollups:
+                added += self._read_rotated(first=True)
+            try:
+                f = open(self.path, 'rb')
+            except OSError:
+                return added
+
+            with f:
+                stat = os.fstat(f.fileno())
+                if self._inode is not None and stat.st_ino != self._inode:
+                    added += self._read_rotated()
+                elif stat.st_size < self._offset:
+                    self._reset()
+                size = stat.st_size
+                if size == self._offset:
+                    return added
+                settled = size == self._last_size or time.time() - stat.st_mtime >= self.refresh_interval
+                self._last_size = size
+                self._inode = stat.st_ino
+                added += self._read(f, size, settled)
+
+            return added
+
+    def _read_rotated(self, first=False):
+        # Called with the lock held. Finish the segment that was rotated to
+        # <path>.1 (or, on the first refresh, all of it) and start the
+        # next; a file replaced any other way resets the rollups
+        try:
+            f = open(self.path + '.1', 'rb')
+        except OSError:
+            if not first:
+                self._reset()
+            return 0
+
+        with f:
+            stat = os.fstat(f.fileno())
+            if first:
+                self._start_segment()
+            elif stat.st_ino != self._inode:
+                self._reset()
+                return 0
+            added = self._read(f, stat.st_size, settled=True)
+        self._start_segment()
+        return added
+
+    def _read(self, f, size, settled):
+        # Called with the lock held: parse f from the current offset
+        added = 0
+        f.seek(self._offset)
+        if self._header is None:
+            self._header = f.readline()
+            self._offset = f.tell()
+
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            end = block.rfind(b'\n') + 1
+            if not end:
+                # An unterminated last line, if the writer is done with it
+                if not block or not settled or self._offset + len(block) != size:
+                    break
+                end = len(block)
+                block += b'\n'
+
+            frame = pd.read_csv(io.BytesIO(self._header + block[:end]),
+                                usecols=KEY_COLUMNS + ['expectedYield', 'date'])
+            added += self._add(frame)
+            self._offset += end
+            f.seek(self._offset)
+
+        return added
+
+    def maybe_refresh(self):
+        """
+        Refresh at most once per refresh_interval
+        """
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def _add(self, frame):
+        # Called with the lock held
+        frame = pd.DataFrame({
+            **{column: _normalize_column(frame[column]) for column in KEY_COLUMNS},
+            'date': pd.to_datetime(frame['date'], errors='coerce').to_numpy(),
+            'yield': pd.to_numeric(frame['expectedYield'], errors='coerce')
+        }).dropna(subset=['date', 'yield'])
+        if frame.empty:
+            return 0
+
+        # Roll rows up to the finest key once; coarser rollups regroup these
+        frame['period'] = frame['date'].to_numpy().astype('datetime64[D]')
+        daily = frame.groupby(KEY_COLUMNS + ['period'], observed=True)['yield'].agg(STAT_NAMES).reset_index()
+        days = daily['period'].to_numpy().astype('datetime64[D]')
+
+        for granularity, unit in GRANULARITIES.items():
+            daily['period'] = days.astype(f'datetime64[{unit}]').astype('datetime64[D]')
+            for mask in product([True, False], repeat=3):
+                keys = [column for column, keep in zip(KEY_COLUMNS, mask) if keep]
+                grouped = daily.groupby(keys + ['period'], observed=True).agg(STAT_AGGREGATES)
+                groups = grouped.groupby(level=keys, observed=True) if keys else [((), grouped)]
+                for values, part in groups:
+                    values = dict(zip(keys, values if isinstance(values, tuple) else (values,)))
+                    key = tuple(values.get(column, ALL) for column in KEY_COLUMNS) + (granularity,)
+                    self._merge(key, part.index.get_level_values('period').to_numpy(), part)
+
+        return len(frame)
+
+    def _merge(self, key, periods, stats):
+        # Fold new per-period stats into the key's sorted rollup arrays
+        rollup = {'period': periods.astype('datetime64[D]')}
+        rollup.update({name: stats[name].to_numpy(np.float64) for name in STAT_NAMES})
+        current = self._rollups.get(key)
+        if current is not None:
+            period, inverse = np.unique(np.concatenate([current['period'], rollup['period']]), return_inverse=True)
+            merged = {
+                'period': period,
+                'count': np.zeros(len(period)),
+                'sum': np.zeros(len(period)),
+                'min': np.full(len(period), np.inf),
+                'max': np.full(len(period), -np.inf)
+            }
+            for name, combine in [('count', np.add), ('sum', np.add), ('min', np.minimum), ('max', np.maximum)]:
+                combine.at(merged[name], inverse, np.concatenate([current[name], rollup[name]]))
+            rollup = merged
+
+        self._rollups[key] = rollup
+        # The materialized series for this key is stale now
+        self._series.pop(key, None)
+
+    def series(self, crop=ALL, region=ALL, season=ALL, granularity='month'):
+        """
+        Return the rollup series for a crop, region and season
+
+        The result maps 'period' (datetime64), 'count', 'mean', 'min' and
+        'max' to arrays ordered by period. Crop, region and season may be
+        ALL (or None) to aggregate over that dimension.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+        self.maybe_refresh()
+        key = (_normalize(crop), _normalize(region), _normalize(season), granularity)
+        series = self._series.get(key)
+        if series is not None:
+            return series
+
+        with self._lock:
+            rollup = self._rollups.get(key)
+            if rollup is None:
+                rollup = {'period': np.array([], dtype='datetime64[D]'), **{name: np.array([]) for name in STAT_NAMES}}
+            series = {
+                'period': rollup['period'],
+                'count': rollup['count'].astype(np.int64),
+                'mean': rollup['sum'] / np.maximum(rollup['count'], 1),
+                'min': rollup['min'],
+                'max': rollup['max']
+            }
+            self._series[key] = series
+            return series
+
+def downsample(series, max_points):
+    """
+    Reduce a series to at most max_points while keeping its shape
+
+    Min/max bucketing: the first and last points are kept, and the points
+    between them are split into equal buckets that each contribute the
+    point with their lowest and highest mean, in time order, so peaks and
+    dips survive. Selected points keep their own statistics.
+    """
+    if max_points is not None and max_points < 2:
+        raise ValueError("max_points must be at least 2")
+    n_points = len(series['period'])
+    if max_points is None or n_points <= max_points:
+        return series
+
+    # Bucket id for every interior point
+    n_buckets = (max_points - 2) // 2
+    keep = [np.array([0, n_points - 1])]
+    if n_buckets:
+        interior = np.arange(1, n_points - 1)
+        bucket = (interior - 1) * n_buckets // (n_points - 2)
+        values = series['mean'][interior]
+
+        # Buckets are contiguous runs, so reduceat finds each extreme in
+        # one pass; the first point equal to it is the one kept
+        starts = np.flatnonzero(np.r_[True, np.diff(bucket) != 0])
+        sizes = np.diff(np.r_[starts, len(interior)])
+        for reduce in (np.minimum, np.maximum):
+            hits = np.flatnonzero(values == np.repeat(reduce.reduceat(values, starts), sizes))
+            _, first = np.unique(bucket[hits], return_index=True)
+            keep.append(interior[hits[first]])
+
+    index = np.unique(np.concatenate(keep))
+    return {name: values[index] for name, values in series.items()}
+
+def format_period(period, granularity):
+    """
+    Label a period as YYYY-MM for monthly series and YYYY-MM-DD for daily ones
+    """
+    return str(period)[:7] if granularity == 'month' else str(period)
+
+def append_history(rows, path=PREDICTION_HISTORY_PATH):
+    """
+    Append served predictions to the prediction history CSV
+
+    rows are dicts with 'crop' and 'yield' and optionally 'region',
+    'season' and the other HISTORY_COLUMNS inputs; the date is today.
+    """
+    if not rows:
+        return
+
+    date = time.strftime('%Y-%m-%d')
+    frame = pd.DataFrame([{
+        'crop': row['crop'],
+        'temperature': row.get('temperature'),
+        'rainfall': row.get('rainfall'),
+        'soilType': row.get('soil_type'),
+        'season': row.get('season'),
+        'expectedYield': round(row['yield'], 2),
+        'region': row.get('region'),
+        'date': date
+    } for row in rows], columns=HISTORY_COLUMNS)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Written in one append so concurrent servers rarely interleave rows
+    data = frame.to_csv(index=False, header=not os.path.exists(path))
+    with open(path, 'a') as f:
+        f.write(data)
+
+class HistoryWriter:
+    """
+    Buffers served predictions and appends them to the history CSV from a
+    background thread, so recording costs a request one list append
+
+    Rows are flushed every flush_interval seconds or once HISTORY_FLUSH_ROWS
+    are pending. When the file reaches max_bytes it is rotated to
+    <path>.1 (replacing the previous one), which caps the disk used;
+    HistoricalIndex keeps its rollups across the rotation. Writers in
+    other processes are serialized by a lock on <path>.lock, so only one
+    of them writes the header or rotates.
+    """
+
+    def __init__(self, path=PREDICTION_HISTORY_PATH, max_bytes=HISTORY_MAX_BYTES,
+                 flush_interval=HISTORY_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []
+        self._thread = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, rows):
+        """
+        Queue rows (as taken by append_history) for the next flush
+        """
+        with self._lock:
+            room = max(HISTORY_MAX_PENDING - len(self._pending), 0)
+            if len(rows) > room:
+                self.dropped += len(rows) - room
+                rows = rows[:room]
+            self._pending.extend(rows)
+            pending = len(self._pending)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+        if pending >= HISTORY_FLUSH_ROWS:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Append every pending row now
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path + '.lock', 'a') as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                        os.replace(self.path, self.path + '.1')
+                    append_history(rows, self.path)
+                self.written += len(rows)
+            except OSError as e:
+                print(f"Warning: could not record prediction history: {e}")
+
+    def close(self):
+        """
+        Stop the background thread and flush what is left
+        """
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
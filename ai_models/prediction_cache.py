@@ -0,0 +1,123 @@
+# Prediction Cache
+# This file contains a bounded LRU/TTL cache for yield and price predictions,
+# keyed by crop and quantized request inputs so repeated what-if queries with
+# nearly identical slider values are served from memory.
+
+from collections import OrderedDict
+import threading
+import json
+import time
+import os
+
+# Bucket width per request field; inputs are snapped to the nearest bucket
+DEFAULT_BUCKETS = {
+    'soil_quality': 0.1,
+    'rainfall': 10.0,
+    'temperature': 0.5,
+    'area': 0.1,
+    'fertilizer': 5.0
+}
+
+CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 300))
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with per-entry TTL that clears itself whenever
+    the model version it is asked about changes
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL, buckets=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.buckets = dict(DEFAULT_BUCKETS if buckets is None else buckets)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, params):
+        """
+        Snap the bucketed fields of a request to their bucket centre
+
+        Predictions are made on the quantized values, so a cached answer is
+        exactly what a fresh computation for the same bucket would return.
+        """
+        quantized = dict(params)
+        for field, width in self.buckets.items():
+            value = quantized.get(field)
+            if value is not None and width:
+                quantized[field] = round(round(value / width) * width, 10)
+        return quantized
+
+    def key(self, quantized):
+        return tuple(sorted((field, value) for field, value in quantized.items()))
+
+    def _check_version(self, version):
+        # Called with the lock held: a new model invalidates everything
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """
+        Return the cached value for key, or None on a miss or expired entry
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        """
+        Store value for key, evicting the least recently used entries
+        """
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return hit/miss counters and the current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'model_version': self._version,
+                'buckets': self.buckets
+            }
+
+def cache_from_env():
+    """
+    Build a cache using PREDICTION_CACHE_* settings; buckets may be
+    overridden with a JSON object in PREDICTION_CACHE_BUCKETS
+    """
+    buckets = dict(DEFAULT_BUCKETS)
+    if os.environ.get('PREDICTION_CACHE_BUCKETS'):
+        buckets.update(json.loads(os.environ['PREDICTION_CACHE_BUCKETS']))
+    return PredictionCache(buckets=buckets)
@@ -0,0 +1,245 @@
+# Incremental Yield Model Retraining
+# This file refreshes the published yield model with realized yields that
+# arrived since its last training run: new trees are grown on the delta
+# with warm_start, validated against a holdout, and a new versioned
+# artifact is published only if it is not worse than the current one.
+
+import argparse
+import copy
+import pickle
+import json
+import time
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from yield_predictor import (
+    FeatureLayout, feature_columns, save_artifact, new_version, load_validation, _scaler_arrays, MODEL_PATH
+)
+
+# Realized yields reported back by farmers, in the crop-yield-data.csv schema
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+MONGO_DB = os.environ.get('YIELD_OUTCOMES_DB', 'smart-agriculture')
+MONGO_COLLECTION = os.environ.get('YIELD_OUTCOMES_COLLECTION', 'yielddatas')
+
+OUTCOME_FIELDS = ['crop', 'temperature', 'rainfall', 'soilType', 'season', 'expectedYield', 'region', 'date']
+
+# Documents fetched per round trip and converted to a frame at a time
+MONGO_BATCH_SIZE = 10_000
+
+REPORT_PATH = 'model/yield_retrain_report.json'
+
+def fetch_mongo_delta(watermark):
+    """
+    Return outcome rows inserted after the watermark and the new watermark
+
+    The watermark is the last ObjectId consumed; ObjectIds grow with
+    insertion time, so the delta is one indexed range query on _id. The
+    cursor is read in batches of MONGO_BATCH_SIZE documents, each turned
+    into a frame before the next is fetched.
+    """
+    try:
+        from bson import ObjectId
+        from pymongo import MongoClient
+    except ImportError:
+        raise ImportError("Reading outcomes from MongoDB requires pymongo (pip install pymongo)")
+
+    frames = []
+    client = MongoClient(MONGO_URL)
+    try:
+        query = {'_id': {'$gt': ObjectId(watermark)}} if watermark else {}
+        cursor = client[MONGO_DB][MONGO_COLLECTION].find(
+            query, {field: 1 for field in OUTCOME_FIELDS}
+        ).sort('_id', 1).batch_size(MONGO_BATCH_SIZE)
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == MONGO_BATCH_SIZE:
+                frames.append(pd.DataFrame(batch, columns=OUTCOME_FIELDS))
+                watermark, batch = str(batch[-1]['_id']), []
+        if batch:
+            frames.append(pd.DataFrame(batch, columns=OUTCOME_FIELDS))
+            watermark = str(batch[-1]['_id'])
+    finally:
+        client.close()
+
+    if not frames:
+        return pd.DataFrame(columns=OUTCOME_FIELDS), watermark
+    return pd.concat(frames, ignore_index=True), watermark
+
+def fetch_csv_delta(path, watermark):
+    """
+    Return the rows of an outcomes CSV past the watermark (a row count)
+    """
+    rows_seen = int(watermark or 0)
+    frame = pd.read_csv(path, skiprows=range(1, rows_seen + 1) if rows_seen else None)
+    return frame, str(rows_seen + len(frame))
+
+def encode(layout, frame):
+    """
+    Encode outcome rows into the current model's scaled feature matrix
+
+    The feature set is fixed by the published model: crops, regions or
+    soil types it has never seen only contribute through the feature
+    store's marginals until the next full retrain.
+    """
+    frame = frame.dropna(subset=['expectedYield'])
+    X = layout.transform_columns(feature_columns(frame), len(frame))
+    return X, frame['expectedYield'].to_numpy(np.float64)
+
+def load_current(model_path):
+    """
+    Load the published pickle artifact with its layout
+    """
+    with open(model_path, 'rb') as f:
+        model_data = pickle.load(f)
+    if not isinstance(model_data['model'], RandomForestRegressor):
+        raise TypeError("Incremental retraining needs a RandomForestRegressor artifact")
+
+    mean, scale = _scaler_arrays(model_data['scaler'], len(model_data['feature_names']))
+    return model_data, FeatureLayout(model_data['feature_names'], mean, scale, model_data.get('feature_store'))
+
+def grow(model, X, y, new_trees, max_trees, seed):
+    """
+    Return a copy of model with new_trees more trees fitted on (X, y)
+
+    With max_trees set, the oldest trees are dropped so the forest (and
+    its inference cost) stays bounded across nightly runs.
+    """
+    candidate = copy.deepcopy(model)
+    candidate.set_params(warm_start=True, n_estimators=len(candidate.estimators_) + new_trees,
+                         random_state=seed, n_jobs=-1)
+    candidate.fit(X, y)
+
+    if max_trees and len(candidate.estimators_) > max_trees:
+        candidate.estimators_ = candidate.estimators_[-max_trees:]
+    candidate.set_params(warm_start=False, n_estimators=len(candidate.estimators_), n_jobs=None)
+    return candidate
+
+def retrain(model_path=MODEL_PATH, source='mongo', outcomes_path=None,
+            report_path=REPORT_PATH, new_trees=20, max_trees=300, holdout=0.2,
+            min_rows=100, tolerance=0.0, seed=42):
+    """
+    Grow the published forest on outcomes since its watermark and publish
+    the result if it is not worse on the holdout
+
+    The holdout is a random share of the delta plus the validation split
+    saved when the model was trained, rows neither the current nor the
+    candidate forest has seen, so the new trees must fit the recent data
+    without degrading on history. A rejected run leaves the watermark
+    where it was, so its outcomes are retried with the next delta.
+    Returns the run report.
+    """
+    started = time.time()
+    model_data, layout = load_current(model_path)
+    watermark_key = f'{source}_watermark'
+    watermark = model_data.get(watermark_key)
+
+    if source == 'mongo':
+        delta, new_watermark = fetch_mongo_delta(watermark)
+    else:
+        delta, new_watermark = fetch_csv_delta(outcomes_path, watermark)
+
+    report = {
+        'parent_version': model_data.get('version'),
+        'source': source,
+        'watermark': watermark,
+        'delta_rows': int(len(delta)),
+        'published': False
+    }
+
+    X_delta, y_delta = encode(layout, delta)
+    if len(y_delta) < min_rows:
+        report['reason'] = f"only {len(y_delta)} new rows (need {min_rows})"
+        return _finish(report, report_path, started)
+
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(y_delta)) < holdout
+    X_train, y_train = X_delta[~test], y_delta[~test]
+
+    # The saved validation split guards against forgetting history; base
+    # rows the current model was fit on would bias the check towards it
+    validation = load_validation(model_path)
+    X_holdout, y_holdout = X_delta[test], y_delta[test]
+    if validation is not None:
+        X_holdout = np.vstack([X_holdout, validation[0]])
+        y_holdout = np.concatenate([y_holdout, validation[1]])
+    if not len(y_holdout):
+        report['reason'] = "no holdout rows"
+        return _finish(report, report_path, started)
+
+    current = model_data['model']
+    candidate = grow(current, X_train, y_train, new_trees, max_trees, seed)
+    current_mae = mean_absolute_error(y_holdout, current.predict(X_holdout))
+    candidate_mae = mean_absolute_error(y_holdout, candidate.predict(X_holdout))
+    report.update({
+        'train_rows': int(len(y_train)),
+        'holdout_rows': int(len(y_holdout)),
+        'validation_rows': 0 if validation is None else int(len(validation[1])),
+        'current_mae': float(current_mae),
+        'candidate_mae': float(candidate_mae),
+        'n_trees': len(candidate.estimators_)
+    })
+
+    if candidate_mae > current_mae * (1 + tolerance):
+        report['reason'] = "candidate is worse on the holdout"
+        return _finish(report, report_path, started)
+
+    version = new_version()
+    save_artifact({
+        **model_data,
+        'model': candidate,
+        'version': version,
+        'parent_version': model_data.get('version'),
+        watermark_key: new_watermark
+    }, model_path, validation=validation)
+    report.update({'published': True, 'version': version, 'new_watermark': new_watermark})
+    return _finish(report, report_path, started)
+
+def _finish(report, report_path, started):
+    report['seconds'] = time.time() - started
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if report['published']:
+        print(f"Published {report['version']} ({report['n_trees']} trees): holdout MAE "
+              f"{report['current_mae']:.1f} -> {report['candidate_mae']:.1f}")
+    else:
+        print(f"Kept {report['parent_version']}: {report['reason']}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally retrain the yield model on new outcomes")
+    parser.add_argument('--model', default=MODEL_PATH, help="published pickle artifact to grow")
+    parser.add_argument('--source', choices=['mongo', 'csv'], default='mongo', help="where new outcomes come from")
+    parser.add_argument('--outcomes', default=None, help="outcomes CSV when --source csv")
+    parser.add_argument('--report', default=REPORT_PATH, help="where to write the JSON run report")
+    parser.add_argument('--new-trees', type=int, default=20, help="trees to grow on the new outcomes")
+    parser.add_argument('--max-trees', type=int, default=300, help="drop the oldest trees beyond this (0 = keep all)")
+    parser.add_argument('--holdout', type=float, default=0.2, help="share of new outcomes held out")
+    parser.add_argument('--min-rows', type=int, default=100, help="skip the run below this many new outcomes")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="relative MAE increase still accepted")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.source == 'csv' and not args.outcomes:
+        parser.error("--outcomes is required with --source csv")
+
+    retrain(
+        model_path=args.model,
+        source=args.source,
+        outcomes_path=args.outcomes,
+        report_path=args.report,
+        new_trees=args.new_trees,
+        max_trees=args.max_trees,
+        holdout=args.holdout,
+        min_rows=args.min_rows,
+        tolerance=args.tolerance,
+        seed=args.seed
+    )
@@ -2,26 +2,91 @@
 # This file runs a Flask API server that serves the trained ML models
 # for crop yield prediction and disease detection.
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
 import sys
+import atexit
 import json
 import random
 
 # Add the current directory to the path so we can import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from prediction_cache import cache_from_env
+from historical_index import HistoricalIndex, HistoryWriter, downsample, format_period, PREDICTION_HISTORY_PATH
 
 # Import our prediction modules
 try:
-    from yield_predictor import predict_yield
-    from disease_detection import predict_disease
+    from yield_predictor import (
+        predict_yield, predict_yield_batch, predict_scenarios, get_model_info,
+        get_model_version, start_background_training, get_readiness
+    )
+    from disease_detection import predict_disease, load_disease_model
 except ImportError:
     print("Warning: Could not import prediction modules. Using mock data instead.")
     predict_yield = None
+    predict_yield_batch = None
+    predict_scenarios = None
+    get_model_info = None
+    get_model_version = None
+    start_background_training = None
+    get_readiness = None
     predict_disease = None
+    load_disease_model = None
 
 app = Flask(__name__)
 
+# Run directly, app.run starts a debug reloader: this parent process only
+# watches files while a child serves, so it must not train or load models
+RELOADER_PARENT = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+# Train the yield model once in the background if no artifact exists;
+# requests are served from the baseline until it is ready
+if start_background_training and not RELOADER_PARENT:
+    start_background_training()
+
+# Load the disease model and class names once and run a warm-up pass, so
+# the first /predict-disease request is not slow
+if load_disease_model and not RELOADER_PARENT:
+    try:
+        load_disease_model()
+    except Exception as e:
+        print(f"Warning: Disease model not loaded: {e}")
+
+# Cache of (yield, price) keyed by crop + quantized inputs, cleared on model change
+prediction_cache = cache_from_env()
+
+# Yield rollups over crop-yield-data.csv and over served predictions, built
+# once here; later reads pick up appended rows
+historical_index = HistoricalIndex()
+historical_index.refresh()
+prediction_history = HistoricalIndex(PREDICTION_HISTORY_PATH)
+prediction_history.refresh()
+
+# Appends served predictions to the history CSV off the request path,
+# flushing what is left when the server exits
+history_writer = HistoryWriter(PREDICTION_HISTORY_PATH)
+atexit.register(history_writer.close)
+
+# Base yields (kg/ha) used for mock predictions and price calculation
+BASE_YIELDS = {
+    'wheat': 4500,
+    'rice': 6000,
+    'corn': 3200,
+    'soybeans': 2800,
+    'cotton': 1500,
+    'sugarcane': 8000
+}
+
+# Base market price per kg for each crop
+PRICE_PER_KG = {
+    'wheat': 22,
+    'rice': 28,
+    'corn': 18,
+    'soybeans': 35,
+    'cotton': 52,
+    'sugarcane': 15
+}
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """
@@ -29,66 +94,78 @@ def predict():
     """
     try:
         # Get input data from request
-        data = request.json
+        params = parse_predict_params(request.json)
         
-        # Extract parameters
-        crop = data.get('crop')
-        soil_quality = float(data.get('soil_quality', 5))
-        rainfall = float(data.get('rainfall', 1000))
-        temperature = float(data.get('temperature', 25))
-        area = float(data.get('area', 1))
-        fertilizer = float(data.get('fertilizer', 100))
+        # Add p10/p50/p90/std across the forest's trees when asked for
+        intervals = request.args.get('intervals', 'false').lower() == 'true'
         
-        # If we have the prediction function, use it
-        if predict_yield:
-            predicted_yield = predict_yield(crop, soil_quality, rainfall, temperature, area, fertilizer)
-        else:
-            # Otherwise, generate mock data
-            base_yields = {
-                'wheat': 4500,
-                'rice': 6000,
-                'corn': 3200,
-                'soybeans': 2800,
-                'cotton': 1500,
-                'sugarcane': 8000
-            }
-            base_yield = base_yields.get(crop, 4000)
-            # Add some randomness
-            predicted_yield = base_yield * (0.9 + 0.2 * random.random())
+        # Served from the prediction cache when the same inputs were seen recently
+        [prediction] = predict_cached([params], intervals)
+        record_predictions([params], [prediction])
         
-        # Calculate a mock price based on the yield
-        price_per_kg = {
-            'wheat': 22,
-            'rice': 28,
-            'corn': 18,
-            'soybeans': 35,
-            'cotton': 52,
-            'sugarcane': 15
-        }
-        base_price = price_per_kg.get(crop, 25)
-        # Inverse relationship with yield (higher yield, slightly lower price)
-        predicted_price = base_price * (1.0 - 0.1 * (predicted_yield / base_yields.get(crop, 4000) - 1))
+        # Return prediction results
+        return jsonify(build_prediction(params['crop'], *prediction))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Endpoint for scoring a list of crop prediction requests in one pass
+    """
+    try:
+        # Get the list of inputs from the request
+        rows = [parse_predict_params(data) for data in request.json]
         
-        # Determine health status
-        health_probability = random.random()
-        if health_probability > 0.7:
-            health_status = "healthy"
-        elif health_probability > 0.3:
-            health_status = "warning"
-        else:
-            health_status = "danger"
+        intervals = request.args.get('intervals', 'false').lower() == 'true'
         
-        # Return prediction results
-        return jsonify({
-            'crop': crop,
-            'yield': round(predicted_yield),
-            'price': round(predicted_price * 100) / 100,
-            'status': health_status
-        })
+        # Cache misses are scored together: one feature matrix, one forest pass
+        predictions = predict_cached(rows, intervals)
+        record_predictions(rows, predictions)
+        
+        return jsonify([
+            build_prediction(row['crop'], *prediction)
+            for row, prediction in zip(rows, predictions)
+        ])
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/predict/scenarios', methods=['POST'])
+def predict_scenarios_api():
+    """
+    Endpoint streaming yield and price for every point of a what-if grid as NDJSON
+    """
+    if not predict_scenarios:
+        return jsonify({'error': 'Yield model not available'}), 503
+    
+    try:
+        spec = parse_scenario_spec(request.json)
+        intervals = request.args.get('intervals', 'false').lower() == 'true'
+        n_points, chunks = predict_scenarios(spec, intervals=intervals)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        # One write per scored chunk keeps memory flat for large grids
+        for results in chunks:
+            yield ''.join(json.dumps(format_scenario(result)) + '\n' for result in results)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Scenario-Count': str(n_points)}
+    )
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Endpoint reporting prediction cache hit/miss counters
+    """
+    return jsonify(prediction_cache.stats())
+
 @app.route('/health-check', methods=['POST'])
 def health_check():
     """
@@ -123,40 +200,207 @@ def health_check():
 @app.route('/historical-data', methods=['GET'])
 def historical_data():
     """
-    Endpoint for historical yield data
+    Endpoint for historical yield data, served from precomputed rollups
     """
     try:
-        # Get crop from query parameters
-        crop = request.args.get('crop', 'wheat')
+        # Get the series to look up from query parameters; an omitted crop,
+        # region or season aggregates over all of them
+        crop = request.args.get('crop')
+        region = request.args.get('region')
+        season = request.args.get('season')
+        granularity = request.args.get('granularity', 'month')
+        max_points = request.args.get('max_points', type=int)
         
-        # Generate mock historical data
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
+        # observed: crop-yield-data.csv; predicted: yields served by /predict
+        source = request.args.get('source', 'observed')
+        if source not in ('observed', 'predicted'):
+            raise ValueError("source must be 'observed' or 'predicted'")
+        index = historical_index if source == 'observed' else prediction_history
         
-        base_yields = {
-            'wheat': [3800, 3900, 4100, 4300, 4400, 4500],
-            'rice': [5200, 5300, 5500, 5700, 5900, 6000],
-            'corn': [2800, 2900, 3000, 3100, 3150, 3200],
-            'soybeans': [2400, 2500, 2600, 2700, 2750, 2800]
-        }
-        
-        # Use the base yields for the requested crop, or generate random data
-        if crop in base_yields:
-            crop_data = base_yields[crop]
-        else:
-            # Generate random increasing data
-            start_value = 2000 + random.randint(0, 2000)
-            crop_data = [start_value]
-            for i in range(5):
-                crop_data.append(crop_data[-1] + random.randint(50, 200))
+        # Charts get at most max_points, picked to keep peaks and dips
+        series = downsample(index.series(crop, region, season, granularity), max_points)
         
         # Create the response data
-        data = [{'month': month, 'yield': yield_value} for month, yield_value in zip(months, crop_data)]
+        data = [{
+            'month': format_period(period, granularity),
+            'yield': round(mean),
+            'count': count,
+            'min_yield': round(low),
+            'max_yield': round(high)
+        } for period, count, mean, low, high in zip(
+            series['period'], series['count'].tolist(), series['mean'].tolist(),
+            series['min'].tolist(), series['max'].tolist()
+        )]
         
         return jsonify(data)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/predict-disease', methods=['POST'])
+def predict_disease_api():
+    """
+    Endpoint for plant disease detection from an uploaded leaf image
+    """
+    try:
+        if not predict_disease:
+            return jsonify({'error': 'Disease model not available'}), 503
+        if 'file' not in request.files:
+            return jsonify({'error': 'No image file uploaded'}), 400
+        
+        return jsonify(predict_disease(request.files['file'].read()))
+    
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness endpoint: 200 once the trained yield model is loaded, 503 before
+    """
+    if not get_readiness:
+        # Mock predictions need no model
+        return jsonify({'ready': True})
+    
+    readiness = get_readiness()
+    return jsonify(readiness), (200 if readiness['ready'] else 503)
+
+@app.route('/model-info', methods=['GET'])
+def model_info():
+    """
+    Endpoint reporting the loaded yield model version and load time
+    """
+    if not get_model_info:
+        return jsonify({'loaded': False})
+    return jsonify(get_model_info())
+
+def parse_predict_params(data):
+    """
+    Extract yield model parameters from a request body, applying defaults
+    """
+    return {
+        'crop': data.get('crop'),
+        'soil_quality': float(data.get('soil_quality', 5)),
+        'rainfall': float(data.get('rainfall', 1000)),
+        'temperature': float(data.get('temperature', 25)),
+        'area': float(data.get('area', 1)),
+        'fertilizer': float(data.get('fertilizer', 100)),
+        # Optional keys into the feature store
+        'region': data.get('region'),
+        'season': data.get('season'),
+        'soil_type': data.get('soil_type')
+    }
+
+def parse_scenario_spec(data):
+    """
+    Extract a scenario sweep from a request body; each field is a value,
+    a list of values or a range, and unswept fields (missing or null) take
+    the /predict defaults
+    """
+    defaults = parse_predict_params({})
+    return {field: default if data.get(field) is None else data[field] for field, default in defaults.items()}
+
+def format_scenario(result):
+    """
+    Round a scored grid point and add its price
+    """
+    result['yield'] = round(result['yield'])
+    result['price'] = round(get_price(result['crop'], result['yield']) * 100) / 100
+    for key in ['p10', 'p50', 'p90', 'std']:
+        if result.get(key) is not None:
+            result[key] = round(result[key] * 100) / 100
+    return result
+
+def get_mock_yield(crop):
+    """
+    Generate a mock yield around the crop's base yield
+    """
+    base_yield = BASE_YIELDS.get(crop, 4000)
+    # Add some randomness
+    return base_yield * (0.9 + 0.2 * random.random())
+
+def get_price(crop, predicted_yield):
+    """
+    Calculate a mock price based on the yield
+    """
+    base_price = PRICE_PER_KG.get(crop, 25)
+    # Inverse relationship with yield (higher yield, slightly lower price)
+    return base_price * (1.0 - 0.1 * (predicted_yield / BASE_YIELDS.get(crop, 4000) - 1))
+
+def predict_cached(rows, intervals=False):
+    """
+    Return (yield, price, interval) for each row, scoring only the cache misses
+
+    interval is None unless intervals is set and a trained model is loaded.
+    """
+    # Without the model, generate mock data
+    if not predict_yield:
+        mock_yields = [get_mock_yield(row['crop']) for row in rows]
+        return [(y, get_price(row['crop'], y), None) for row, y in zip(rows, mock_yields)]
+    
+    version = get_model_version()
+    rows = [prediction_cache.quantize(row) for row in rows]
+    keys = [prediction_cache.key({**row, 'intervals': intervals}) for row in rows]
+    results = [prediction_cache.get(key, version) for key in keys]
+    
+    misses = [i for i, result in enumerate(results) if result is None]
+    if len(misses) == 1:
+        # Single-row fast path
+        predictions = [predict_yield(**rows[misses[0]], intervals=intervals)]
+    else:
+        predictions = predict_yield_batch([rows[i] for i in misses], intervals=intervals)
+    
+    for i, prediction in zip(misses, predictions):
+        interval = None
+        if intervals:
+            interval, prediction = prediction, prediction['yield']
+        results[i] = (prediction, get_price(rows[i]['crop'], prediction), interval)
+        prediction_cache.put(keys[i], version, results[i])
+    
+    return results
+
+def build_prediction(crop, predicted_yield, predicted_price, interval=None):
+    """
+    Build the prediction response for a crop and its predicted yield and price
+    """
+    # Determine health status
+    health_probability = random.random()
+    if health_probability > 0.7:
+        health_status = "healthy"
+    elif health_probability > 0.3:
+        health_status = "warning"
+    else:
+        health_status = "danger"
+    
+    prediction = {
+        'crop': crop,
+        'yield': round(predicted_yield),
+        'price': round(predicted_price * 100) / 100,
+        'status': health_status
+    }
+    
+    # Spread across the forest's trees
+    if interval and interval['std'] is not None:
+        for key in ['p10', 'p50', 'p90', 'std']:
+            prediction[key] = round(interval[key] * 100) / 100
+    
+    return prediction
+
+def record_predictions(rows, predictions):
+    """
+    Queue served yields for the prediction history
+    """
+    # Mock and baseline yields are not model predictions and would only
+    # pollute the history
+    if not predict_yield or get_model_version() is None:
+        return
+    history_writer.record([
+        {**row, 'yield': prediction[0]}
+        for row, prediction in zip(rows, predictions)
+    ])
+
 def get_recommendations(health_status):
     """
     Get recommendations based on health status
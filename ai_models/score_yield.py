@@ -0,0 +1,250 @@
+# Bulk Yield Scoring
+# This file scores large CSVs in the crop-yield-data.csv schema offline:
+# the input is streamed in chunks, scored across a process pool that loads
+# the model once per worker, and written in order to CSV or Parquet.
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import argparse
+import json
+import io
+import time
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from yield_predictor import ModelRegistry, feature_columns, score_columns, MODEL_PATH, CHUNK_SIZE
+
+# Bytes read per step when skipping already scored input rows
+SKIP_BLOCK_SIZE = 1024 * 1024
+
+# Model state for worker processes, loaded once by _init_worker
+_worker_state = {}
+
+def _init_worker(model_path):
+    """
+    Load the model once per worker process
+    """
+    state = ModelRegistry(model_path).get()
+    if state is None:
+        raise FileNotFoundError(f"No trained model at {model_path}")
+    _worker_state['state'] = state
+
+def _score_chunk(index, chunk):
+    """
+    Score one chunk and return it with a predicted_yield column
+    """
+    chunk['predicted_yield'] = score_columns(_worker_state['state'], feature_columns(chunk), len(chunk))
+    return index, chunk
+
+class CsvWriter:
+    """
+    Appends scored chunks to one CSV file
+    """
+
+    def __init__(self, path, resume_bytes=None):
+        self.path = path
+        if resume_bytes is None:
+            self.file = open(path, 'w', newline='')
+        else:
+            # Drop anything written after the last checkpoint
+            self.file = open(path, 'r+', newline='')
+            self.file.truncate(resume_bytes)
+            self.file.seek(resume_bytes)
+
+    def write(self, index, chunk):
+        chunk.to_csv(self.file, header=self.file.tell() == 0, index=False)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """
+    Writes each scored chunk as a numbered part file in a dataset directory
+    """
+
+    def __init__(self, path, resume_bytes=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, index, chunk):
+        part = os.path.join(self.path, f'part-{index:05d}.parquet')
+        chunk.to_parquet(part + '.tmp', index=False)
+        os.replace(part + '.tmp', part)
+        return None
+
+    def close(self):
+        pass
+
+def _open_after(path, rows):
+    """
+    Open a CSV positioned at the start of data row rows + 1
+
+    Lines are counted a block at a time and the file is seeked past them,
+    so resuming never parses or tracks the skipped rows. Returns the binary
+    file and the column names from the header.
+    """
+    f = open(path, 'rb')
+    columns = pd.read_csv(io.BytesIO(f.readline()), nrows=0).columns.tolist()
+    while rows:
+        position = f.tell()
+        block = f.read(SKIP_BLOCK_SIZE)
+        if not block:
+            break
+        n_lines = block.count(b'\n')
+        if n_lines < rows:
+            rows -= n_lines
+            continue
+        end = -1
+        for _ in range(rows):
+            end = block.index(b'\n', end + 1)
+        f.seek(position + end + 1)
+        rows = 0
+    return f, columns
+
+def _checkpoint_path(output):
+    return output.rstrip('/') + '.checkpoint.json'
+
+def _read_checkpoint(output, settings):
+    """
+    Return the checkpoint for output if it was written with the same settings
+    """
+    path = _checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+
+    for key, value in settings.items():
+        if checkpoint.get(key) != value:
+            raise ValueError(f"Checkpoint {path} was written with {key}={checkpoint.get(key)!r}, "
+                             f"not {value!r}; delete it to start over")
+    return checkpoint
+
+def _write_checkpoint(output, checkpoint):
+    path = _checkpoint_path(output)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def score(input_path, output_path, model_path=MODEL_PATH, output_format=None,
+          chunk_size=CHUNK_SIZE, n_jobs=None, resume=False):
+    """
+    Score input_path chunk by chunk and write the results in input order
+
+    Up to two chunks per worker are in flight, so memory stays bounded by
+    the chunk size. After every chunk is written a checkpoint records how
+    far the output got; with resume=True scoring restarts after it.
+    """
+    started = time.time()
+    n_jobs = n_jobs or os.cpu_count()
+    output_format = output_format or ('parquet' if output_path.endswith('.parquet') else 'csv')
+
+    # Version the checkpoint by the model it was scored with
+    state = ModelRegistry(model_path).get()
+    if state is None:
+        raise FileNotFoundError(f"No trained model at {model_path}")
+    settings = {
+        'input': os.path.abspath(input_path),
+        'chunk_size': chunk_size,
+        'format': output_format,
+        'model_version': state['version']
+    }
+
+    checkpoint = _read_checkpoint(output_path, settings) if resume else None
+    next_chunk = checkpoint['chunks'] if checkpoint else 0
+    rows_done = checkpoint['rows'] if checkpoint else 0
+    if checkpoint:
+        print(f"Resuming after chunk {next_chunk} ({rows_done} rows already scored)")
+
+    Writer = ParquetWriter if output_format == 'parquet' else CsvWriter
+    writer = Writer(output_path, checkpoint['output_bytes'] if checkpoint else None)
+
+    # Skip the rows covered by the checkpoint without parsing them
+    if rows_done:
+        input_file, columns = _open_after(input_path, rows_done)
+        reader = pd.read_csv(input_file, chunksize=chunk_size, header=None, names=columns)
+    else:
+        input_file = None
+        reader = pd.read_csv(input_path, chunksize=chunk_size)
+    rows_scored = 0
+    pending = {}
+    finished = {}
+
+    def flush():
+        # Write finished chunks in input order and checkpoint after each
+        nonlocal next_chunk, rows_done, rows_scored
+        while next_chunk in finished:
+            chunk = finished.pop(next_chunk)
+            output_bytes = writer.write(next_chunk, chunk)
+            next_chunk += 1
+            rows_done += len(chunk)
+            rows_scored += len(chunk)
+            _write_checkpoint(output_path, {**settings, 'chunks': next_chunk, 'rows': rows_done,
+                                            'output_bytes': output_bytes})
+            elapsed = time.time() - started
+            print(f"chunk {next_chunk}: {rows_done} rows, {rows_scored / elapsed:,.0f} rows/sec")
+
+    def collect():
+        # Wait for at least one chunk to finish, then write what is in order
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            del pending[future]
+            index, chunk = future.result()
+            finished[index] = chunk
+        flush()
+
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(model_path,)) as pool:
+            index = next_chunk
+            for chunk in reader:
+                # A finished run resumes onto an empty remainder; writing it
+                # would add an empty part and move the checkpoint
+                if chunk.empty:
+                    continue
+                pending[pool.submit(_score_chunk, index, chunk)] = index
+                index += 1
+                while len(pending) >= 2 * n_jobs:
+                    collect()
+            while pending:
+                collect()
+    finally:
+        writer.close()
+        if input_file is not None:
+            input_file.close()
+
+    elapsed = time.time() - started
+    print(f"Scored {rows_scored} rows in {elapsed:.1f}s ({rows_scored / max(elapsed, 1e-9):,.0f} rows/sec) "
+          f"with model {state['version']}; {rows_done} rows in {output_path}")
+    return {'rows': rows_scored, 'total_rows': rows_done, 'seconds': elapsed,
+            'rows_per_second': rows_scored / max(elapsed, 1e-9)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV in the crop-yield-data.csv schema with the yield model")
+    parser.add_argument('input', help="CSV to score")
+    parser.add_argument('output', help="output CSV file, or Parquet dataset directory")
+    parser.add_argument('--model', default=MODEL_PATH, help="model artifact (pickle or mmap manifest.json)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help="output format (default: from the output extension)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument('--n-jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--resume', action='store_true', help="continue after the last checkpointed chunk")
+    args = parser.parse_args()
+
+    score(
+        args.input,
+        args.output,
+        model_path=args.model,
+        output_format=args.format,
+        chunk_size=args.chunk_size,
+        n_jobs=args.n_jobs,
+        resume=args.resume
+    )
@@ -0,0 +1,211 @@
+# Yield Model Training
+# This file runs a cross-validated hyperparameter search for the crop yield
+# model across a process pool and publishes the best model as the artifact.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import tempfile
+import json
+import time
+import os
+import sys
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler
+from sklearn.metrics import r2_score
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from yield_predictor import (
+    load_data, add_training_store_features, preprocess_data, save_artifact, new_version,
+    MODEL_PATH, DATA_PATH, MAX_TRAINING_ROWS
+)
+
+# Candidate hyperparameters for the random forest
+PARAM_GRID = {
+    'n_estimators': [100, 200, 400],
+    'max_depth': [None, 12, 24],
+    'min_samples_leaf': [1, 2, 5],
+    'max_features': [1.0, 0.5, 'sqrt']
+}
+
+REPORT_PATH = 'model/yield_training_report.json'
+
+# Fold data for worker processes, memory-mapped from the shared cache
+_worker_data = {}
+
+def _init_worker(cache_dir):
+    """
+    Map the cached per-fold feature matrices, target and fold ids once per worker
+    """
+    _worker_data['y'] = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+    _worker_data['folds'] = np.load(os.path.join(cache_dir, 'folds.npy'), mmap_mode='r')
+    _worker_data['X'] = [
+        np.load(os.path.join(cache_dir, f'X{fold}.npy'), mmap_mode='r')
+        for fold in range(int(_worker_data['folds'].max()) + 1)
+    ]
+
+def _score_fold(candidate, params, fold, seed):
+    """
+    Fit one candidate on all folds but one and score it on the held-out fold
+    """
+    started = time.time()
+    X, y, folds = _worker_data['X'][fold], _worker_data['y'], _worker_data['folds']
+    test = folds == fold
+
+    model = RandomForestRegressor(random_state=seed, n_jobs=1, **params)
+    model.fit(X[~test], y[~test])
+    score = r2_score(y[test], model.predict(X[test]))
+
+    return candidate, fold, float(score), started, time.time()
+
+def build_features(data, fit_rows=None):
+    """
+    Join the feature store and encode and scale data, fitting the store and
+    scaler on fit_rows only (all rows when None)
+
+    Returns the feature matrix, target, scaler, feature names and store.
+    """
+    data, store = add_training_store_features(data.copy(), fit_rows=fit_rows)
+    X, y, scaler, feature_names = preprocess_data(data, fit_rows=fit_rows)
+    return X, y, scaler, feature_names, store
+
+def cache_fold_data(cache_dir, data, n_folds, seed):
+    """
+    Write one feature matrix per fold, the target and fold assignment once
+    for all workers
+
+    Each fold's matrix comes from a feature store and scaler fit on that
+    fold's training rows, so the held-out yields never leak into its features.
+    """
+    folds = np.empty(len(data), dtype=np.int8)
+    for fold, (_, test_index) in enumerate(KFold(n_folds, shuffle=True, random_state=seed).split(data)):
+        folds[test_index] = fold
+
+    for fold in range(n_folds):
+        X, y, _, _, _ = build_features(data, fit_rows=np.flatnonzero(folds != fold))
+        np.save(os.path.join(cache_dir, f'X{fold}.npy'), np.ascontiguousarray(X, dtype=np.float32))
+    np.save(os.path.join(cache_dir, 'y.npy'), np.asarray(y, dtype=np.float32))
+    np.save(os.path.join(cache_dir, 'folds.npy'), folds)
+
+def get_candidates(n_iter, seed):
+    """
+    Return the full parameter grid, or n_iter random samples of it
+    """
+    if n_iter:
+        return list(ParameterSampler(PARAM_GRID, n_iter=n_iter, random_state=seed))
+    return list(ParameterGrid(PARAM_GRID))
+
+def search(data, candidates, n_folds=5, n_jobs=None, seed=42):
+    """
+    Cross-validate every candidate across a process pool
+
+    Each (candidate, fold) fit is a separate task so all cores stay busy.
+    Returns one result dict per candidate with fold scores and timings.
+    """
+    results = [{'params': params, 'fold_scores': [None] * n_folds, 'fit_seconds': 0.0,
+                'started': None, 'finished': None} for params in candidates]
+
+    with tempfile.TemporaryDirectory(prefix='yield-cv-') as cache_dir:
+        cache_fold_data(cache_dir, data, n_folds, seed)
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+            futures = [
+                pool.submit(_score_fold, candidate, params, fold, seed)
+                for candidate, params in enumerate(candidates)
+                for fold in range(n_folds)
+            ]
+            for future in as_completed(futures):
+                candidate, fold, score, started, finished = future.result()
+                result = results[candidate]
+                result['fold_scores'][fold] = score
+                result['fit_seconds'] += finished - started
+                result['started'] = started if result['started'] is None else min(result['started'], started)
+                result['finished'] = finished if result['finished'] is None else max(result['finished'], finished)
+
+    for result in results:
+        result['mean_score'] = float(np.mean(result['fold_scores']))
+        result['std_score'] = float(np.std(result['fold_scores']))
+        result['wall_seconds'] = result.pop('finished') - result.pop('started')
+
+    return results
+
+def train(data_path=DATA_PATH, model_path=MODEL_PATH, report_path=REPORT_PATH,
+          n_folds=5, n_iter=0, n_jobs=None, max_rows=MAX_TRAINING_ROWS, seed=42):
+    """
+    Run the search, refit the best candidate on all data and publish it
+    """
+    started = time.time()
+    n_jobs = n_jobs or os.cpu_count()
+
+    data = load_data(data_path, max_rows=max_rows)
+    print(f"Loaded {len(data)} rows")
+
+    candidates = get_candidates(n_iter, seed)
+    print(f"Searching {len(candidates)} candidates x {n_folds} folds on {n_jobs} processes")
+    results = search(data, candidates, n_folds=n_folds, n_jobs=n_jobs, seed=seed)
+    best = max(results, key=lambda result: result['mean_score'])
+    print(f"Best CV score: {best['mean_score']:.4f} with {best['params']}")
+
+    # Refit the winner on the full sample using every core, with the
+    # feature store and scaler that ship with it built from all rows
+    X, y, scaler, feature_names, store = build_features(data)
+    refit_started = time.time()
+    model = RandomForestRegressor(random_state=seed, n_jobs=n_jobs, **best['params'])
+    model.fit(X, y)
+    model.set_params(n_jobs=None)
+    refit_seconds = time.time() - refit_started
+
+    version = new_version()
+    save_artifact({
+        'model': model,
+        'scaler': scaler,
+        'feature_names': feature_names,
+        'feature_store': store,
+        'version': version,
+        'params': best['params'],
+        'cv_score': best['mean_score']
+    }, model_path)
+
+    report = {
+        'version': version,
+        'data_path': data_path,
+        'rows': int(len(y)),
+        'n_folds': n_folds,
+        'n_jobs': n_jobs,
+        'best_params': best['params'],
+        'best_score': best['mean_score'],
+        'refit_seconds': refit_seconds,
+        'total_seconds': time.time() - started,
+        'candidates': sorted(results, key=lambda result: -result['mean_score'])
+    }
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Model saved to {model_path}, report written to {report_path} "
+          f"({report['total_seconds']:.1f}s total)")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search for the yield model")
+    parser.add_argument('--data', default=DATA_PATH, help="training CSV in the crop-yield-data.csv schema")
+    parser.add_argument('--output', default=MODEL_PATH, help="where to publish the best model")
+    parser.add_argument('--report', default=REPORT_PATH, help="where to write the JSON search report")
+    parser.add_argument('--cv', type=int, default=5, help="number of cross-validation folds")
+    parser.add_argument('--n-iter', type=int, default=0, help="random candidates to try (0 = full grid)")
+    parser.add_argument('--n-jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--max-rows', type=int, default=MAX_TRAINING_ROWS, help="row cap for the training sample")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    train(
+        data_path=args.data,
+        model_path=args.output,
+        report_path=args.report,
+        n_folds=args.cv,
+        n_iter=args.n_iter,
+        n_jobs=args.n_jobs,
+        max_rows=args.max_rows,
+        seed=args.seed
+    )
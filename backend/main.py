@@ -7,16 +7,61 @@
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from db.mongo import save_prediction_to_db
-from model.disease_model import predict_disease
-
-import shutil
-import uuid
+from model import disease_model
+from model.disease_model import predict_disease_batch, preprocess_image, load_model
+from utils.micro_batcher import MicroBatcher, MAX_BATCH_SIZE
+from utils.inference_pool import InferencePool, INFERENCE_WORKERS
+from utils.upload_helper import save_upload
+from utils.dedup_cache import DedupCache, read_and_hash
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
 import os
 from datetime import datetime
 
+# Worker processes that own the disease model, so inference never blocks
+# the event loop; with DISEASE_INFERENCE_WORKERS=0 it runs in this process
+inference_pool = InferencePool(INFERENCE_WORKERS, MAX_BATCH_SIZE) if INFERENCE_WORKERS else None
+
+# Threads decoding uploads; PIL releases the GIL while decoding
+decode_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DISEASE_DECODE_THREADS", os.cpu_count() or 1))
+)
+
+# Predictions by image content hash and model version, so re-uploaded
+# photos skip decoding and inference
+dedup_cache = DedupCache()
+
+def serving_model_version():
+    # Version of the model that actually scores uploads: the one the
+    # inference workers (or this process) loaded at startup, not the file
+    # on disk, which may have been replaced since. None disables dedup
+    return inference_pool.model_version if inference_pool else disease_model.loaded_version
+
+# Gathers concurrent uploads into one forward pass per batch, keeping every
+# inference worker busy
+disease_batcher = MicroBatcher(
+    inference_pool.predict_batch if inference_pool else predict_disease_batch,
+    concurrency=INFERENCE_WORKERS or 1
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if inference_pool:
+        inference_pool.start()
+    else:
+        await asyncio.to_thread(load_model)
+    disease_batcher.start()
+    yield
+    await disease_batcher.stop()
+    if inference_pool:
+        inference_pool.close()
+    decode_executor.shutdown()
+
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -39,16 +84,32 @@ app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 @app.post("/predict-disease/")
 async def predict_disease_api(file: UploadFile = File(...)):
     try:
-        # Save uploaded file with unique name
-        file_ext = os.path.splitext(file.filename)[1]
-        file_name = f"{uuid.uuid4()}{file_ext}"
+        # Hash while the upload streams in; identical images share one
+        # stored file named by their content hash
+        data, digest = await read_and_hash(file)
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        file_name = f"{digest}{file_ext}"
         file_path = os.path.join(UPLOAD_DIR, file_name)
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Run prediction
-        result = predict_disease(file_path)
+        # Store the original unless it already is, in parallel with inference
+        saving = None
+        if not os.path.exists(file_path):
+            saving = asyncio.create_task(save_upload(file_path, data))
+
+        async def predict():
+            # Run prediction
+            img_array = await asyncio.get_running_loop().run_in_executor(decode_executor, preprocess_image, data)
+            return await disease_batcher.submit(img_array)
+
+        try:
+            model_version = serving_model_version()
+            if model_version is None:
+                result = await predict()
+            else:
+                result, _ = await dedup_cache.get_or_compute((digest, model_version), predict)
+        finally:
+            if saving:
+                await saving
 
         # Relative path for serving from frontend
         # Normalize slashes (for Windows)
@@ -72,6 +133,13 @@ async def predict_disease_api(file: UploadFile = File(...)):
         return {"success": False, "error": str(e)}
 
 
+# Batch size, queue depth and latency metrics of the disease batcher, and
+# hit rate of the upload dedup cache
+@app.get("/predict-disease/stats")
+async def disease_batcher_stats():
+    return {**disease_batcher.stats(), "dedup": dedup_cache.stats()}
+
+
 
 #CONTRACTS
 #CONTRACTS
@@ -1,11 +1,23 @@
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
 from PIL import Image
 import numpy as np
+import io
+import threading
 import os
 
-# Load the trained model
-model = load_model("model/model_disease.h5")
+# Path of the trained model; it is loaded on first use, so processes that
+# only hand images to the inference workers never import TensorFlow
+MODEL_PATH = os.environ.get("DISEASE_MODEL_PATH", "model/model_disease.h5")
+
+# Exported serving model taking raw uint8 images; preferred when present
+SERVING_MODEL_PATH = os.environ.get("DISEASE_SERVING_MODEL_PATH", "model/disease_serving")
+
+IMAGE_SIZE = (224, 224)
+
+model = None
+serve = None
+# get_model_version() of the file load_model loaded, None until then
+loaded_version = None
+_model_lock = threading.Lock()
 
 # Define class labels (should match your training folder structure)
 class_names = [
@@ -26,19 +38,73 @@ class_names = [
     'Tomato___healthy'
 ]
 
-def predict_disease(img_path: str):
-    # Load and preprocess image
-    img = image.load_img(img_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0) / 255.0
-
-    # Predict
-    predictions = model.predict(img_array)
-    predicted_class_index = np.argmax(predictions[0])
-    predicted_class = class_names[predicted_class_index]
-    confidence = float(np.max(predictions[0]))
-
-    return {
-        "predicted_class": predicted_class,
-        "confidence": round(confidence, 4)
-    }
+def get_model_version():
+    # Identifies the model file on disk; the model a process serves is
+    # loaded_version, which stays put when the file is replaced later
+    path = SERVING_MODEL_PATH if os.path.exists(SERVING_MODEL_PATH) else MODEL_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.basename(path)}-{stat.st_mtime_ns}-{stat.st_size}"
+
+def make_serving_function(keras_model):
+    # Fixed-signature function over raw uint8 images; resize and rescale
+    # run in the graph, and one trace serves every batch size
+    import tensorflow as tf
+
+    @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.uint8, name="images")])
+    def serve_images(images):
+        x = tf.image.resize(images, IMAGE_SIZE) / 255.0
+        return keras_model(x, training=False)
+
+    return serve_images
+
+def load_model(intra_op_threads=None):
+    # Load the serving function once and run a warm-up pass
+    global model, serve, loaded_version
+    with _model_lock:
+        if serve is None:
+            version = get_model_version()
+            import tensorflow as tf
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if os.path.exists(SERVING_MODEL_PATH):
+                model = tf.saved_model.load(SERVING_MODEL_PATH)
+                serve_images = model.serve
+            else:
+                model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+                serve_images = make_serving_function(model)
+            serve_images(np.zeros((1, *IMAGE_SIZE, 3), dtype=np.uint8))
+            serve = serve_images
+            # A file replaced while loading gives no trustworthy version
+            loaded_version = version if version == get_model_version() else None
+    return serve
+
+def preprocess_image(img):
+    # Decode from a path or the raw upload bytes. For JPEGs, draft mode
+    # lets the decoder downscale by 1/2-1/8 to the smallest size that is
+    # still at least 224x224, skipping most of the IDCT work
+    if isinstance(img, (bytes, bytearray)):
+        img = io.BytesIO(img)
+    img = Image.open(img)
+    img.draft("RGB", IMAGE_SIZE)
+    img = img.convert("RGB").resize(IMAGE_SIZE, Image.NEAREST)
+    # Kept as uint8; the serving function rescales in the graph
+    return np.asarray(img, dtype=np.uint8)
+
+def predict_disease_batch(img_arrays):
+    # One forward pass for a list or stacked array of preprocessed images
+    predictions = load_model()(np.asarray(img_arrays, dtype=np.uint8)).numpy()
+
+    results = []
+    for row in predictions:
+        predicted_class_index = np.argmax(row)
+        results.append({
+            "predicted_class": class_names[predicted_class_index],
+            "confidence": round(float(np.max(row)), 4)
+        })
+    return results
+
+def predict_disease(img):
+    return predict_disease_batch([preprocess_image(img)])[0]
@@ -0,0 +1,86 @@
+# Upload Dedup Cache
+# This file contains a bounded LRU cache of disease predictions keyed by
+# the content hash of the uploaded image and the model version, so a
+# re-uploaded photo is answered without decoding or inference.
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+
+DEDUP_CACHE_SIZE = int(os.environ.get("DISEASE_DEDUP_CACHE_SIZE", 10000))
+
+# Bytes read from the upload per hashing step
+READ_CHUNK_SIZE = 1024 * 1024
+
+async def read_and_hash(file):
+    """
+    Read an UploadFile in chunks, hashing as it streams in
+
+    Returns the full contents and their SHA-256 hex digest.
+    """
+    hasher = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = await file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), hasher.hexdigest()
+
+class DedupCache:
+    """
+    LRU map of (content hash, model version) to prediction
+
+    Concurrent requests for the same key share one computation: the first
+    caller starts it and every caller awaits its result.
+    """
+
+    def __init__(self, max_size=DEDUP_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return (prediction, cached) for key, awaiting compute() on a miss
+
+        compute() runs in its own task that every caller awaits through a
+        shield, so a caller that is cancelled (say, its client hung up)
+        does not cancel the computation other callers are waiting on.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key], True
+        if key in self._pending:
+            self.hits += 1
+            return await asyncio.shield(self._pending[key]), True
+
+        self.misses += 1
+        task = asyncio.get_running_loop().create_task(compute())
+        self._pending[key] = task
+        task.add_done_callback(lambda task: self._finish(key, task))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key, task):
+        # Cache a successful result; failures are retried by the next caller
+        del self._pending[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = task.result()
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
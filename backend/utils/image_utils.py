@@ -1,9 +1,7 @@
-from tensorflow.keras.preprocessing import image
+from PIL import Image
 import numpy as np
 
 def preprocess_image(img_path):
-    img = image.load_img(img_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = img_array / 255.0  # Normalize
-    return img_array
+    # Raw uint8 batch of one; the serving model resizes and rescales in the graph
+    img = Image.open(img_path).convert("RGB")
+    return np.expand_dims(np.asarray(img, dtype=np.uint8), axis=0)
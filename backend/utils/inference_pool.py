@@ -0,0 +1,135 @@
+# Inference Pool
+# This file runs disease model inference in a pool of worker processes
+# that each own a copy of the TF model. Batches are written into
+# preallocated shared memory slots, so image tensors are never pickled.
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import queue
+import os
+
+import numpy as np
+
+from model.disease_model import IMAGE_SIZE
+
+# Worker processes; 0 runs inference in the API process instead
+INFERENCE_WORKERS = int(os.environ.get("DISEASE_INFERENCE_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Seconds start() waits for every worker to load the model
+WARM_UP_TIMEOUT = float(os.environ.get("DISEASE_WARM_UP_TIMEOUT", 300))
+
+# Per-worker state: shared memory views attached by name
+_worker_slots = {}
+_warm_up_barrier = None
+
+def _init_worker(intra_op_threads, warm_up_barrier):
+    """
+    Load the model once per worker process
+    """
+    global _warm_up_barrier
+    _warm_up_barrier = warm_up_barrier
+    from model.disease_model import load_model
+    load_model(intra_op_threads)
+
+def _warm_up(name, shape):
+    """
+    Score one image, then wait until every worker has done the same
+
+    The barrier holds each worker on its task, so n_workers warm-up tasks
+    land on n_workers distinct processes. Returns the version of the model
+    the worker loaded.
+    """
+    from model import disease_model
+    _predict_slot(name, shape, 1)
+    _warm_up_barrier.wait(WARM_UP_TIMEOUT)
+    return disease_model.loaded_version
+
+def _attach(name, shape):
+    if name not in _worker_slots:
+        # Attached once per worker; the API process owns and unlinks it
+        block = shared_memory.SharedMemory(name=name)
+        _worker_slots[name] = (block, np.ndarray(shape, dtype=np.uint8, buffer=block.buf))
+    return _worker_slots[name][1]
+
+def _predict_slot(name, shape, n_images):
+    """
+    Score the first n_images of a shared memory slot
+    """
+    from model.disease_model import predict_disease_batch
+    return predict_disease_batch(_attach(name, shape)[:n_images])
+
+class InferencePool:
+    """
+    Worker processes scoring batches of preprocessed images
+
+    Each in-flight batch gets one of 2 * n_workers shared memory slots
+    sized for max_batch_size images; predict_batch blocks until a slot is
+    free, so it is meant to run off the event loop. Workers load the model
+    once, so model_version (set by start) holds for the pool's lifetime;
+    it is None if the workers did not all load the same version.
+    """
+
+    def __init__(self, n_workers=INFERENCE_WORKERS, max_batch_size=16):
+        self.n_workers = n_workers
+        self.max_batch_size = max_batch_size
+        self.shape = (max_batch_size, *IMAGE_SIZE, 3)
+        self.model_version = None
+        self._executor = None
+        self._blocks = []
+        self._free = queue.Queue()
+
+    def start(self):
+        if self._executor is not None:
+            return
+        nbytes = int(np.prod(self.shape)) * np.dtype(np.uint8).itemsize
+        for _ in range(2 * self.n_workers):
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._blocks.append(block)
+            self._free.put((block.name, np.ndarray(self.shape, dtype=np.uint8, buffer=block.buf)))
+
+        # Spawned rather than forked: TensorFlow is not fork-safe. The
+        # cores are split between the workers' TF thread pools
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(max(1, (os.cpu_count() or 1) // self.n_workers), context.Barrier(self.n_workers))
+        )
+
+        # Workers are spawned on demand; one warm-up task each starts them
+        # all and loads the model before the first request arrives
+        name, view = self._free.get()
+        try:
+            view[:1] = 0
+            warm_ups = [self._executor.submit(_warm_up, name, self.shape) for _ in range(self.n_workers)]
+            versions = {future.result() for future in warm_ups}
+            self.model_version = versions.pop() if len(versions) == 1 else None
+        finally:
+            self._free.put((name, view))
+
+    def predict_batch(self, images):
+        """
+        Score a list of preprocessed images in one worker
+        """
+        if len(images) > self.max_batch_size:
+            raise ValueError(f"Batch of {len(images)} images exceeds max_batch_size {self.max_batch_size}")
+        name, view = self._free.get()
+        try:
+            np.stack(images, out=view[:len(images)])
+            return self._executor.submit(_predict_slot, name, self.shape, len(images)).result()
+        finally:
+            self._free.put((name, view))
+
+    def close(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        while not self._free.empty():
+            self._free.get()
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
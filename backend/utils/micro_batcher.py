@@ -0,0 +1,173 @@
+# Micro Batcher
+# This file contains an asyncio queue that gathers concurrent inference
+# requests into small batches, so the disease model runs one forward pass
+# per batch instead of one per uploaded image.
+
+from collections import deque
+import asyncio
+import time
+import os
+
+import numpy as np
+
+MAX_BATCH_SIZE = int(os.environ.get('DISEASE_MAX_BATCH_SIZE', 16))
+MAX_WAIT_MS = float(os.environ.get('DISEASE_MAX_WAIT_MS', 10))
+
+# Recent per-request latencies kept for the percentile metrics
+LATENCY_WINDOW = 1000
+
+def _cancel(batch):
+    # Cancel the callers' futures of a batch that will not be scored
+    for _, future in batch:
+        future.cancel()
+
+class MicroBatcher:
+    """
+    Groups submitted items into batches of up to max_batch_size, waiting at
+    most max_wait seconds after the first item of a batch arrives
+
+    predict_batch receives a list of items and must return one result per
+    item, in order. It runs in the loop's default executor, so the event
+    loop keeps accepting requests while a batch is being scored. Up to
+    concurrency batches are scored at once, for backends with several
+    inference workers.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT_MS / 1000,
+                 concurrency=1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self._loop = None
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._in_flight = set()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = {}
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self):
+        """
+        Start the batching task on the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._in_flight = set()
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the batching task; requests queued or being scored are cancelled
+        """
+        if self._worker is None:
+            return
+        for task in [self._worker, *self._in_flight]:
+            task.cancel()
+        await asyncio.gather(self._worker, *self._in_flight, return_exceptions=True)
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+        self._worker = None
+
+    async def submit(self, item):
+        """
+        Queue one item and wait for its row of the batch result
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self._queue.put((item, future))
+        try:
+            return await future
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    async def _collect(self):
+        # Block for the first item, then take more until the batch is full
+        # or the deadline set by the first item passes
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            _cancel(batch)
+            raise
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that gave up no longer need a row
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+
+            # Wait for a free slot; requests keep queueing meanwhile, so the
+            # next batch grows while every worker is busy
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                _cancel(batch)
+                raise
+            task = loop.create_task(self._score(loop, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _score(self, loop, batch):
+        try:
+            results = await loop.run_in_executor(None, self.predict_batch, [item for item, _ in batch])
+        except asyncio.CancelledError:
+            # Stopped mid-batch: the callers would otherwise wait forever
+            _cancel(batch)
+            raise
+        except Exception as e:
+            self.errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """
+        Batching metrics: request and batch counts, batch size histogram,
+        current queue depth and per-request latency percentiles in ms
+        """
+        latencies = np.array(self._latencies) * 1000
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'batch_sizes': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'in_flight': len(self._in_flight),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None
+        }
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from fastapi import UploadFile
 from uuid import uuid4
 
@@ -18,3 +19,13 @@ def save_profile_image(file: UploadFile, email: str) -> str:
     return file_path.replace("\\", "/")
 
 
+def _write_file(file_path: str, data: bytes):
+    # Written under a temporary name so readers never see a partial file
+    tmp_path = f"{file_path}.{uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+async def save_upload(file_path: str, data: bytes):
+    # Write off the event loop so the handler keeps serving meanwhile
+    await asyncio.to_thread(_write_file, file_path, data)
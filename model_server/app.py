@@ -1,22 +1,76 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, List, Union
+import asyncio
 import random
+import json
 import os
 import sys
 import uvicorn
 
 # Import prediction functions
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from prediction_cache import cache_from_env
+from micro_batcher import MicroBatcher
+from historical_index import HistoricalIndex, HistoryWriter, downsample, format_period, PREDICTION_HISTORY_PATH
 try:
-    from yield_predictor import predict_yield
-    from disease_detection import predict_disease
+    from yield_predictor import (
+        predict_yield, predict_yield_batch, predict_scenarios, get_model_info,
+        get_model_version, start_background_training, get_readiness
+    )
+    from disease_detection import predict_disease, predict_disease_batch, preprocess_image, load_disease_model
 except ImportError:
     predict_yield = None
+    predict_yield_batch = None
+    predict_scenarios = None
+    get_model_info = None
+    get_model_version = None
+    start_background_training = None
+    get_readiness = None
     predict_disease = None
-
-app = FastAPI(title="Smart Agriculture Model API")
+    predict_disease_batch = None
+    preprocess_image = None
+    load_disease_model = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Train the yield model once in the background if no artifact exists;
+    # requests are served from the baseline until it is ready
+    if start_background_training:
+        start_background_training()
+    # Load the disease model and class names once and run a warm-up pass
+    if load_disease_model:
+        try:
+            load_disease_model()
+        except Exception as e:
+            print(f"Warning: Disease model not loaded: {e}")
+    # Build the historical rollups once; later reads pick up appended rows
+    historical_index.refresh()
+    prediction_history.refresh()
+    if disease_batcher:
+        disease_batcher.start()
+    yield
+    if disease_batcher:
+        await disease_batcher.stop()
+    history_writer.close()
+
+app = FastAPI(title="Smart Agriculture Model API", lifespan=lifespan)
+
+# Cache of (yield, price) keyed by crop + quantized inputs, cleared on model change
+prediction_cache = cache_from_env()
+
+# Yield rollups over crop-yield-data.csv and over served predictions
+historical_index = HistoricalIndex()
+prediction_history = HistoricalIndex(PREDICTION_HISTORY_PATH)
+
+# Appends served predictions to the history CSV off the request path
+history_writer = HistoryWriter(PREDICTION_HISTORY_PATH)
+
+# Gathers concurrent /predict-disease uploads into one forward pass per batch
+disease_batcher = MicroBatcher(predict_disease_batch) if predict_disease_batch else None
 
 # Enable CORS (optional, helps during frontend dev)
 app.add_middleware(
@@ -36,12 +90,66 @@ class PredictRequest(BaseModel):
     temperature: Optional[float] = 25.0
     area: Optional[float] = 1.0
     fertilizer: Optional[float] = 100.0
+    # Optional keys into the feature store (region climatology, crop and soil history)
+    region: Optional[str] = None
+    season: Optional[str] = None
+    soil_type: Optional[str] = None
 
 class PredictResponse(BaseModel):
     crop: str
     yield_: int
     price: float
     status: str
+    # Spread across the forest's trees, returned when intervals=true
+    p10: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    std: Optional[float] = None
+
+class ScenarioRange(BaseModel):
+    # Unknown keys are kept so expand_axis rejects them with a 400
+    model_config = ConfigDict(extra='allow')
+
+    start: float
+    stop: float
+    step: Optional[float] = None
+    num: Optional[int] = None
+
+class ScenarioRequest(BaseModel):
+    # Each field is one value, a list of values or a range to sweep
+    crop: Union[str, List[str]]
+    region: Optional[Union[str, List[str]]] = None
+    season: Optional[Union[str, List[str]]] = None
+    soil_type: Optional[Union[str, List[str]]] = None
+    soil_quality: Union[float, List[float], ScenarioRange] = 5.0
+    rainfall: Union[float, List[float], ScenarioRange] = 1000.0
+    temperature: Union[float, List[float], ScenarioRange] = 25.0
+    area: Union[float, List[float], ScenarioRange] = 1.0
+    fertilizer: Union[float, List[float], ScenarioRange] = 100.0
+
+class CacheStatsResponse(BaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+    model_version: Optional[str] = None
+    buckets: dict
+
+class BatcherStatsResponse(BaseModel):
+    requests: int
+    batches: int
+    errors: int
+    mean_batch_size: float
+    batch_sizes: dict
+    queue_depth: int
+    in_flight: int
+    max_batch_size: int
+    max_wait_ms: float
+    latency_p50_ms: Optional[float] = None
+    latency_p99_ms: Optional[float] = None
 
 class HealthCheckResponse(BaseModel):
     status: str
@@ -51,6 +159,23 @@ class HealthCheckResponse(BaseModel):
 class HistoricalDataPoint(BaseModel):
     month: str
     yield_: int
+    count: Optional[int] = None
+    min_yield: Optional[int] = None
+    max_yield: Optional[int] = None
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    training: bool = False
+    error: Optional[str] = None
+    failures: int = 0
+    retry_in: Optional[float] = None
+
+class ModelInfoResponse(BaseModel):
+    loaded: bool
+    path: Optional[str] = None
+    version: Optional[str] = None
+    loaded_at: Optional[str] = None
+    load_seconds: Optional[float] = None
 
 # ------------------- Helper Functions -------------------
 
@@ -70,6 +195,78 @@ def get_mock_price(crop: str, predicted_yield: float) -> float:
     base_price = price_map.get(crop, 25)
     return base_price * (1.0 - 0.1 * (predicted_yield / (base_price * 200) - 1))
 
+def predict_cached(requests: List[PredictRequest], intervals: bool = False) -> List[tuple]:
+    """
+    Return (yield, price, interval) per request, scoring only the cache misses
+
+    interval is None unless intervals is set and a trained model is loaded.
+    """
+    if not predict_yield_batch:
+        mock_yields = [get_mock_yield(r.crop) for r in requests]
+        return [(y, get_mock_price(r.crop, y), None) for r, y in zip(requests, mock_yields)]
+
+    version = get_model_version()
+    rows = [prediction_cache.quantize(r.model_dump()) for r in requests]
+    keys = [prediction_cache.key({**row, 'intervals': intervals}) for row in rows]
+    results = [prediction_cache.get(key, version) for key in keys]
+
+    misses = [i for i, result in enumerate(results) if result is None]
+    if len(misses) == 1:
+        # Single-row fast path
+        predictions = [predict_yield(**rows[misses[0]], intervals=intervals)]
+    else:
+        predictions = predict_yield_batch([rows[i] for i in misses], intervals=intervals)
+
+    for i, prediction in zip(misses, predictions):
+        interval = None
+        if intervals:
+            interval, prediction = prediction, prediction['yield']
+        results[i] = (prediction, get_mock_price(rows[i]['crop'], prediction), interval)
+        prediction_cache.put(keys[i], version, results[i])
+
+    return results
+
+def build_predict_response(crop: str, predicted_yield: float, predicted_price: float,
+                           interval: Optional[dict] = None) -> PredictResponse:
+    response = PredictResponse(
+        crop=crop,
+        yield_=round(predicted_yield),
+        price=round(predicted_price, 2),
+        status=get_health_status()
+    )
+    if interval and interval['std'] is not None:
+        response.p10 = round(interval['p10'], 2)
+        response.p50 = round(interval['p50'], 2)
+        response.p90 = round(interval['p90'], 2)
+        response.std = round(interval['std'], 2)
+    return response
+
+def format_scenario(result: dict) -> dict:
+    result['yield'] = round(result['yield'])
+    result['price'] = round(get_mock_price(result['crop'], result['yield']), 2)
+    for key in ['p10', 'p50', 'p90', 'std']:
+        if result.get(key) is not None:
+            result[key] = round(result[key], 2)
+    return result
+
+def record_predictions(requests: List[PredictRequest], predictions: List[tuple]):
+    # Mock and baseline yields are not model predictions and would only
+    # pollute the history
+    if not predict_yield or get_model_version() is None:
+        return
+    history_writer.record([
+        {**r.model_dump(), 'yield': prediction[0]}
+        for r, prediction in zip(requests, predictions)
+    ])
+
+def get_health_status() -> str:
+    health_probability = random.random()
+    if health_probability > 0.7:
+        return "healthy"
+    elif health_probability > 0.3:
+        return "warning"
+    return "danger"
+
 def get_recommendations(status: str) -> List[str]:
     if status == "healthy":
         return [
@@ -95,41 +292,71 @@ def get_recommendations(status: str) -> List[str]:
 # ------------------- API Endpoints -------------------
 
 @app.post("/predict", response_model=PredictResponse)
-def predict(request: PredictRequest):
+def predict(request: PredictRequest, intervals: bool = False):
     try:
-        if predict_yield:
-            predicted_yield = predict_yield(
-                crop=request.crop,
-                soil_quality=request.soil_quality,
-                rainfall=request.rainfall,
-                temperature=request.temperature,
-                area=request.area,
-                fertilizer=request.fertilizer
-            )
-        else:
-            predicted_yield = get_mock_yield(request.crop)
+        # Served from the prediction cache when the same inputs were seen recently
+        [prediction] = predict_cached([request], intervals)
+        record_predictions([request], [prediction])
 
-        predicted_price = get_mock_price(request.crop, predicted_yield)
+        return build_predict_response(request.crop, *prediction)
 
-        health_probability = random.random()
-        if health_probability > 0.7:
-            health_status = "healthy"
-        elif health_probability > 0.3:
-            health_status = "warning"
-        else:
-            health_status = "danger"
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return PredictResponse(
-            crop=request.crop,
-            yield_=round(predicted_yield),
-            price=round(predicted_price, 2),
-            status=health_status
-        )
+
+@app.post("/predict/batch", response_model=List[PredictResponse])
+def predict_batch(requests: List[PredictRequest], intervals: bool = False):
+    try:
+        # Cache misses are scored together: one feature matrix, one forest pass
+        predictions = predict_cached(requests, intervals)
+        record_predictions(requests, predictions)
+
+        return [
+            build_predict_response(r.crop, *prediction)
+            for r, prediction in zip(requests, predictions)
+        ]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/predict/scenarios")
+def predict_scenarios_api(request: ScenarioRequest, intervals: bool = False):
+    """
+    Stream yield and price for every point of a what-if grid as NDJSON
+    """
+    if not predict_scenarios:
+        raise HTTPException(status_code=503, detail="Yield model not available")
+
+    try:
+        n_points, chunks = predict_scenarios(request.model_dump(exclude_none=True), intervals=intervals)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def generate():
+        # One write per scored chunk keeps memory flat for large grids
+        for results in chunks:
+            yield ''.join(json.dumps(format_scenario(result)) + '\n' for result in results)
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"X-Scenario-Count": str(n_points)}
+    )
+
+
+@app.get("/cache-stats", response_model=CacheStatsResponse)
+def cache_stats():
+    return CacheStatsResponse(**prediction_cache.stats())
+
+
+@app.get("/disease-batcher-stats", response_model=BatcherStatsResponse)
+def disease_batcher_stats():
+    if not disease_batcher:
+        raise HTTPException(status_code=503, detail="Disease model not available")
+    return BatcherStatsResponse(**disease_batcher.stats())
+
+
 @app.post("/health-check", response_model=HealthCheckResponse)
 def health_check():
     try:
@@ -155,31 +382,53 @@ def health_check():
 
 
 @app.get("/historical-data", response_model=List[HistoricalDataPoint])
-def historical_data(crop: str = "wheat"):
+def historical_data(crop: Optional[str] = None, region: Optional[str] = None, season: Optional[str] = None,
+                    granularity: str = "month", source: str = "observed",
+                    max_points: Optional[int] = None):
+    # Omitted crop, region or season aggregate over all of them
+    # observed: crop-yield-data.csv; predicted: yields served by /predict
+    if source not in ("observed", "predicted"):
+        raise HTTPException(status_code=400, detail="source must be 'observed' or 'predicted'")
+    index = historical_index if source == "observed" else prediction_history
+
     try:
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
-        base_yields = {
-            'wheat': [3800, 3900, 4100, 4300, 4400, 4500],
-            'rice': [5200, 5300, 5500, 5700, 5900, 6000],
-            'corn': [2800, 2900, 3000, 3100, 3150, 3200],
-            'soybeans': [2400, 2500, 2600, 2700, 2750, 2800]
-        }
-
-        if crop in base_yields:
-            crop_data = base_yields[crop]
-        else:
-            start = 2000 + random.randint(0, 2000)
-            crop_data = [start]
-            for _ in range(5):
-                crop_data.append(crop_data[-1] + random.randint(50, 200))
+        # Charts get at most max_points, picked to keep peaks and dips
+        series = downsample(index.series(crop, region, season, granularity), max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return [
+        HistoricalDataPoint(
+            month=format_period(period, granularity),
+            yield_=round(mean),
+            count=count,
+            min_yield=round(low),
+            max_yield=round(high)
+        )
+        for period, count, mean, low, high in zip(
+            series['period'], series['count'].tolist(), series['mean'].tolist(),
+            series['min'].tolist(), series['max'].tolist()
+        )
+    ]
 
-        return [
-            HistoricalDataPoint(month=month, yield_=val)
-            for month, val in zip(months, crop_data)
-        ]
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/model-info", response_model=ModelInfoResponse)
+def model_info():
+    if not get_model_info:
+        return ModelInfoResponse(loaded=False)
+    return ModelInfoResponse(**get_model_info())
+
+
+@app.get("/ready", response_model=ReadinessResponse)
+def ready():
+    if not get_readiness:
+        # Mock predictions need no model
+        return ReadinessResponse(ready=True)
+
+    readiness = ReadinessResponse(**get_readiness())
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=readiness.model_dump())
+    return readiness
 
 
 # ------------------- Run server (for local dev) -------------------
@@ -189,16 +438,17 @@ if __name__ == "__main__":
 
 
 from fastapi import File, UploadFile
-from fastapi.responses import JSONResponse
 
 @app.post("/predict-disease")
 async def predict_disease_api(file: UploadFile = File(...)):
     try:
-        if not predict_disease:
+        if not disease_batcher:
             raise HTTPException(status_code=500, detail="Model not available")
 
         image_bytes = await file.read()
-        prediction = predict_disease(image_bytes)
+        # Decode off the event loop; PIL releases the GIL while decoding
+        image = await asyncio.to_thread(preprocess_image, image_bytes)
+        prediction = await disease_batcher.submit(image)
 
         return JSONResponse(content={
             "plant": prediction["plant"],
@@ -210,7 +460,6 @@ async def predict_disease_api(file: UploadFile = File(...)):
 
 
 from fastapi import UploadFile, File
-from fastapi.responses import JSONResponse
 from PIL import Image
 import io
 
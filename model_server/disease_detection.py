@@ -7,6 +7,12 @@ import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from PIL import Image
+import threading
+import json
+import sys
+import time
+import io
 import os
 
 # Define constants
@@ -15,6 +21,30 @@ BATCH_SIZE = 32
 EPOCHS = 10
 MODEL_PATH = 'model/disease_model.h5'
 
+# Exported serving model (SavedModel) taking raw uint8 images
+SERVING_MODEL_PATH = 'model/disease_serving'
+
+# Quantized TFLite exports of the model for CPU-only serving
+TFLITE_MODEL_PATHS = {
+    'tflite-float16': 'model/disease_model_float16.tflite',
+    'tflite-int8': 'model/disease_model_int8.tflite'
+}
+
+# Inference backends load_disease_model can serve from
+BACKENDS = ['keras', *TFLITE_MODEL_PATHS]
+DISEASE_BACKEND = os.environ.get('DISEASE_BACKEND', 'keras')
+
+# Training images sampled to calibrate int8 quantization ranges
+CALIBRATION_IMAGES = 200
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Class name -> output index mapping written at training time
+CLASS_INDICES_PATH = os.environ.get(
+    'DISEASE_CLASS_INDICES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'class_indices.json')
+)
+
 def create_model(num_classes):
     """
     Create a CNN model for disease detection
@@ -48,9 +78,23 @@ def create_model(num_classes):
     
     return model
 
-def train_model(data_dir):
+def list_images(data_dir):
     """
-    Train the disease detection model using images from data_dir
+    Return sorted (path, class name) pairs for a directory of class folders
+    """
+    images = []
+    for class_name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for file_name in sorted(os.listdir(class_dir)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((os.path.join(class_dir, file_name), class_name))
+    return images
+
+def make_generators(data_dir):
+    """
+    Create the Keras ImageDataGenerator training and validation iterators
     """
     # Set up data generators with augmentation
     train_datagen = ImageDataGenerator(
@@ -82,17 +126,110 @@ def train_model(data_dir):
         subset='validation'
     )
     
-    # Get number of classes
-    num_classes = len(train_generator.class_indices)
+    return train_generator, validation_generator
+
+def split_images(images, validation_split=0.2):
+    """
+    Split (path, class name) pairs into training and validation sets
+
+    Like flow_from_directory, the first validation_split of each class's
+    sorted files is held out, so every class is represented in both.
+    """
+    by_class = {}
+    for path, class_name in images:
+        by_class.setdefault(class_name, []).append((path, class_name))
+    
+    train, validation = [], []
+    for class_images in by_class.values():
+        n_validation = int(len(class_images) * validation_split)
+        validation.extend(class_images[:n_validation])
+        train.extend(class_images[n_validation:])
+    return train, validation
+
+def decode_image(path):
+    """
+    Read and decode one image file into a normalized IMAGE_SIZE float tensor
+    """
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, IMAGE_SIZE) / 255.0
+    image.set_shape((*IMAGE_SIZE, 3))
+    return image
+
+def make_augmentation(rotation_range=20, shift_range=0.2, zoom_range=0.2):
+    """
+    Random rotation (degrees), shift, zoom and horizontal flip applied to
+    whole batches inside the input pipeline
+    """
+    layers = [tf.keras.layers.RandomFlip('horizontal')]
+    if rotation_range:
+        layers.append(tf.keras.layers.RandomRotation(rotation_range / 360))
+    if shift_range:
+        layers.append(tf.keras.layers.RandomTranslation(shift_range, shift_range))
+    if zoom_range:
+        layers.append(tf.keras.layers.RandomZoom(zoom_range))
+    return tf.keras.Sequential(layers)
+
+def make_dataset(images, class_names, batch_size=BATCH_SIZE, augmentation=None, shuffle=False,
+                 cache=None, seed=42):
+    """
+    Build a tf.data pipeline over (path, class name) pairs
+
+    Files are decoded with num_parallel_calls=AUTOTUNE, so decoding and
+    augmentation run on every core, and batches are prefetched while the
+    model trains on the previous one. cache='' keeps decoded images in
+    memory (a file path caches to disk), which suits the validation set:
+    it is decoded once and reused every epoch.
+    """
+    class_index = {name: index for index, name in enumerate(class_names)}
+    unknown = sorted({class_name for _, class_name in images} - set(class_index))
+    if unknown:
+        raise ValueError(f"Images of classes not in class_names: {', '.join(unknown)}")
+    paths = [path for path, _ in images]
+    labels = [class_index[class_name] for _, class_name in images]
+    
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shuffle:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(
+        lambda path, label: (decode_image(path), tf.one_hot(label, len(class_names))),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+    if cache is not None:
+        dataset = dataset.cache(cache)
+    dataset = dataset.batch(batch_size)
+    if augmentation is not None:
+        dataset = dataset.map(
+            lambda batch, labels: (augmentation(batch, training=True), labels),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def make_datasets(data_dir, validation_split=0.2, augmentation=None):
+    """
+    List data_dir once and return (train, validation, class_names) datasets
+    """
+    images = list_images(data_dir)
+    class_names = sorted({class_name for _, class_name in images})
+    train, validation = split_images(images, validation_split)
+    
+    train_dataset = make_dataset(train, class_names, augmentation=augmentation, shuffle=True)
+    validation_dataset = make_dataset(validation, class_names, cache='')
+    return train_dataset, validation_dataset, class_names
+
+def train_model(data_dir):
+    """
+    Train the disease detection model using images from data_dir
+    """
+    # Shear has no Keras preprocessing layer; the other augmentations
+    # match the former ImageDataGenerator settings
+    train_dataset, validation_dataset, class_names = make_datasets(data_dir, augmentation=make_augmentation())
     
     # Create and train the model
-    model = create_model(num_classes)
+    model = create_model(len(class_names))
     
     history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // BATCH_SIZE,
+        train_dataset,
+        validation_data=validation_dataset,
         epochs=EPOCHS
     )
     
@@ -101,40 +238,274 @@ def train_model(data_dir):
     model.save(MODEL_PATH)
     
     # Save class indices for later use
-    class_indices = train_generator.class_indices
+    class_indices = {name: index for index, name in enumerate(class_names)}
     class_names = {v: k for k, v in class_indices.items()}
+    with open(CLASS_INDICES_PATH, 'w') as f:
+        json.dump(class_indices, f)
+    
+    export_serving_model()
     
     return model, class_names, history
 
-def predict_disease(image_path):
+def make_serving_function(model):
+    """
+    Wrap a Keras model in a fixed-signature tf.function that takes a batch
+    of raw uint8 images of any size and resizes and rescales in the graph
+    
+    The fixed signature means one trace serves every request, and calling
+    it directly skips the per-call setup of model.predict.
+    """
+    @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.uint8, name='images')])
+    def serve(images):
+        x = tf.image.resize(images, IMAGE_SIZE) / 255.0
+        return model(x, training=False)
+    
+    return serve
+
+def export_serving_model(model_path=MODEL_PATH, export_dir=SERVING_MODEL_PATH):
+    """
+    Export the trained model as a SavedModel with the uint8 serving function
+    """
+    model = tf.keras.models.load_model(model_path, compile=False)
+    module = tf.Module()
+    module.model = model
+    module.serve = make_serving_function(model)
+    tf.saved_model.save(module, export_dir, signatures={'serving_default': module.serve})
+    print(f"Serving model exported to {export_dir}")
+    return export_dir
+
+def export_tflite_models(data_dir, model_path=MODEL_PATH, n_calibration=CALIBRATION_IMAGES, seed=42):
+    """
+    Export float16 and post-training int8 TFLite versions of the model
+
+    The int8 model is calibrated on a random sample of the images in
+    data_dir and takes uint8 pixels as input, so requests need no float
+    conversion at all. Returns the paths written.
+    """
+    model = tf.keras.models.load_model(model_path, compile=False)
+    
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    float16_model = converter.convert()
+    
+    images = list_images(data_dir)
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(images), size=min(n_calibration, len(images)), replace=False)
+    
+    def representative_dataset():
+        for index in sample:
+            image = preprocess_image(images[index][0])
+            yield [np.expand_dims(image, axis=0).astype(np.float32) / 255.0]
+    
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.uint8
+    int8_model = converter.convert()
+    
+    for backend, tflite_model in [('tflite-float16', float16_model), ('tflite-int8', int8_model)]:
+        path = TFLITE_MODEL_PATHS[backend]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(tflite_model)
+        print(f"{backend} model exported to {path} ({len(tflite_model) / 1e6:.1f} MB)")
+    return dict(TFLITE_MODEL_PATHS)
+
+class TFLiteServe:
     """
-    Predict disease from an image
+    Serving function over a TFLite interpreter with the same contract as
+    make_serving_function: uint8 IMAGE_SIZE batches in, probabilities out
+
+    The interpreter is not thread-safe, so calls are serialized. Its input
+    is resized only when the batch size changes.
     """
-    # Load the model if it exists
+    
+    def __init__(self, path, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._lock = threading.Lock()
+        self._read_details()
+    
+    def _read_details(self):
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+    
+    def _quantize(self, images):
+        dtype = self.input['dtype']
+        if dtype == np.float32:
+            return images.astype(np.float32) / 255.0
+        scale, zero_point = self.input['quantization']
+        if dtype == np.uint8 and zero_point == 0 and np.isclose(scale * 255.0, 1.0):
+            # Raw pixels already are the quantized [0, 1] input
+            return images
+        info = np.iinfo(dtype)
+        return np.clip(np.round(images / 255.0 / scale + zero_point), info.min, info.max).astype(dtype)
+    
+    def _dequantize(self, output):
+        if self.output['dtype'] == np.float32:
+            return output
+        scale, zero_point = self.output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+    
+    def __call__(self, images):
+        images = np.asarray(images, dtype=np.uint8)
+        with self._lock:
+            if self.input['shape'][0] != len(images):
+                self.interpreter.resize_tensor_input(self.input['index'], [len(images), *IMAGE_SIZE, 3])
+                self.interpreter.allocate_tensors()
+                self._read_details()
+            self.interpreter.set_tensor(self.input['index'], self._quantize(images))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self.output['index']))
+
+def load_serving_function(backend=None):
+    """
+    Load the model for an inference backend and return (model, serve)
+
+    serve takes a uint8 batch and returns class probabilities. 'keras'
+    prefers the exported SavedModel over the .h5.
+    """
+    backend = backend or DISEASE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+    
+    if backend in TFLITE_MODEL_PATHS:
+        path = TFLITE_MODEL_PATHS[backend]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{backend} model not found. Export it with export_tflite_models first.")
+        serve = TFLiteServe(path)
+        return serve.interpreter, serve
+    if os.path.exists(SERVING_MODEL_PATH):
+        model = tf.saved_model.load(SERVING_MODEL_PATH)
+        return model, model.serve
     if os.path.exists(MODEL_PATH):
-        model = tf.keras.models.load_model(MODEL_PATH)
-    else:
-        raise FileNotFoundError("Model not found. Please train the model first.")
-    
-    # Load and preprocess the image
-    img = tf.keras.preprocessing.image.load_img(image_path, target_size=IMAGE_SIZE)
-    img_array = tf.keras.preprocessing.image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0) / 255.0
-    
-    # Make prediction
-    predictions = model.predict(img_array)
-    predicted_class = np.argmax(predictions, axis=1)[0]
-    confidence = predictions[0][predicted_class]
-    
-    # TODO: Load class names from saved mapping
-    # For now, return the class index and confidence
-    return {
-        'class_index': int(predicted_class),
-        'confidence': float(confidence)
+        model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+        return model, make_serving_function(model)
+    raise FileNotFoundError("Model not found. Please train the model first.")
+
+# Process-wide model state, loaded once by load_disease_model
+_model_lock = threading.Lock()
+_model_state = None
+
+def load_class_names(path=CLASS_INDICES_PATH):
+    """
+    Read class_indices.json and return the class names in output order
+    """
+    with open(path) as f:
+        class_indices = json.load(f)
+    return [name for name, _ in sorted(class_indices.items(), key=lambda item: item[1])]
+
+def split_class_name(class_name):
+    """
+    Split a class name like 'Potato___Early_blight' into plant and condition
+    """
+    plant, _, condition = class_name.partition('___')
+    if not condition:
+        plant, _, condition = class_name.partition('_')
+    return ' '.join(plant.replace('_', ' ').split()), ' '.join(condition.replace('_', ' ').split())
+
+def load_disease_model():
+    """
+    Load the model for DISEASE_BACKEND and the class names once per
+    process and warm the model up
+
+    Safe to call from every request: later calls return the loaded state.
+    The warm-up forward pass builds the inference graph, so the first real
+    request runs at steady-state speed.
+    """
+    global _model_state
+    if _model_state is not None:
+        return _model_state
+    
+    with _model_lock:
+        if _model_state is not None:
+            return _model_state
+        started = time.perf_counter()
+        model, serve = load_serving_function(DISEASE_BACKEND)
+        
+        class_names = load_class_names() if os.path.exists(CLASS_INDICES_PATH) else None
+        labels = [split_class_name(name) for name in class_names] if class_names else None
+        
+        # Warm-up forward pass on a dummy batch
+        serve(np.zeros((1, *IMAGE_SIZE, 3), dtype=np.uint8))
+        
+        _model_state = {
+            'model': model,
+            'serve': serve,
+            'backend': DISEASE_BACKEND,
+            'class_names': class_names,
+            'labels': labels,
+            'load_seconds': time.perf_counter() - started
+        }
+        return _model_state
+
+def load_image(image):
+    """
+    Open an image given as a path, raw bytes or a PIL image
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image))
+    return Image.open(image)
+
+def preprocess_image(image):
+    """
+    Decode an image (file path, bytes or PIL image) into a 224x224x3
+    uint8 array; rescaling happens inside the serving function
+    """
+    img = load_image(image)
+    # JPEGs decode straight to a 1/2-1/8 scale that still covers IMAGE_SIZE
+    img.draft('RGB', IMAGE_SIZE)
+    img = img.convert('RGB').resize(IMAGE_SIZE)
+    return np.asarray(img, dtype=np.uint8)
+
+def describe_prediction(state, probabilities):
+    """
+    Turn one row of class probabilities into a prediction result
+    """
+    predicted_class = int(np.argmax(probabilities))
+    result = {
+        'class_index': predicted_class,
+        'confidence': float(probabilities[predicted_class])
     }
+    if state['class_names'] and predicted_class < len(state['class_names']):
+        plant, condition = state['labels'][predicted_class]
+        result.update({
+            'class_name': state['class_names'][predicted_class],
+            'plant': plant,
+            'condition': condition
+        })
+    return result
+
+def predict_disease_batch(images):
+    """
+    Predict disease for a list of preprocessed image arrays in one forward pass
+    """
+    state = load_disease_model()
+    predictions = np.asarray(state['serve'](np.stack(images)))
+    return [describe_prediction(state, row) for row in predictions]
+
+def predict_disease(image):
+    """
+    Predict disease from an image (file path, bytes or PIL image)
+    """
+    return predict_disease_batch([preprocess_image(image)])[0]
 
 if __name__ == "__main__":
-    # This would be where you'd train the model if running this file directly
-    print("To train the model, provide a data directory with labeled disease images.")
-    print("Example: train_model('path/to/disease/images')")
+    # python disease_detection.py export [model.h5] [export_dir]
+    # python disease_detection.py export-tflite <data_dir> [model.h5]
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        export_serving_model(*sys.argv[2:4])
+    elif len(sys.argv) > 2 and sys.argv[1] == 'export-tflite':
+        export_tflite_models(*sys.argv[2:4])
+    else:
+        # This would be where you'd train the model if running this file directly
+        print("To train the model, provide a data directory with labeled disease images.")
+        print("Example: train_model('path/to/disease/images')")
+        print("To export the uint8 serving model: python disease_detection.py export")
+        print("To export TFLite models: python disease_detection.py export-tflite path/to/disease/images")
 
@@ -0,0 +1,148 @@
+# Yield Feature Store
+# This file precomputes per-region climatology, historical mean yield per
+# crop and region, and soil-type yield encodings from the training data.
+# They are kept as small arrays indexed by integer codes, so joining them
+# to a request is a few dict and array reads with no DB or file access.
+
+import numpy as np
+import pandas as pd
+
+# Columns the store is keyed by
+STORE_KEYS = ['crop', 'region', 'season', 'soil_type']
+
+# Features the store adds to each row
+STORE_FEATURES = ['region_temperature', 'region_rainfall', 'crop_region_yield', 'soil_yield']
+
+# Store features computed from the yield target; training rows get these
+# out-of-fold so a row's own yield never feeds its feature
+TARGET_FEATURES = ['crop_region_yield', 'soil_yield']
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+def _mean_table(values, a, b, shape):
+    """
+    Mean of values per (a, b) code pair, with marginals in the last row/column
+
+    Codes of -1 mark missing keys. Index n_a (n_b) holds the mean over all
+    values of a (b), which is also where unknown keys are looked up. Pairs
+    never seen fall back to a's marginal, then to the overall mean.
+    """
+    n_a, n_b = shape
+    sums = np.zeros((n_a + 1, n_b + 1))
+    counts = np.zeros((n_a + 1, n_b + 1))
+    for a_index, b_index, mask in [
+        (a, b, (a >= 0) & (b >= 0)),
+        (a, np.full_like(b, n_b), a >= 0),
+        (np.full_like(a, n_a), b, b >= 0),
+        (np.full_like(a, n_a), np.full_like(b, n_b), np.ones(len(a), dtype=bool))
+    ]:
+        np.add.at(sums, (a_index[mask], b_index[mask]), values[mask])
+        np.add.at(counts, (a_index[mask], b_index[mask]), 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table = sums / counts
+    table = np.where(np.isnan(table), table[:, n_b:], table)
+    return np.where(np.isnan(table), table[n_a, n_b], table)
+
+class FeatureStore:
+    """
+    Precomputed region, crop and soil features keyed by integer codes
+
+    Every table has one extra trailing slot holding the marginal mean, so
+    unknown or missing keys resolve to a sensible default instead of NaN.
+    """
+
+    def __init__(self, vocabularies, arrays):
+        self.vocabularies = {key: list(vocabularies.get(key, [])) for key in STORE_KEYS}
+        self.codes = {key: {value: i for i, value in enumerate(values)}
+                      for key, values in self.vocabularies.items()}
+        self.arrays = arrays
+
+    @classmethod
+    def build(cls, data):
+        """
+        Build the store from training rows with STORE_KEYS, temperature,
+        rainfall and yield columns; absent key columns count as unknown
+        """
+        vocabularies, codes = {}, {}
+        for key in STORE_KEYS:
+            if key in data:
+                column = data[key].astype(object).where(data[key].notna())
+                codes[key], uniques = pd.factorize(column.map(_normalize, na_action='ignore'))
+                vocabularies[key] = [str(value) for value in uniques]
+            else:
+                codes[key], vocabularies[key] = np.full(len(data), -1), []
+
+        def column(name):
+            if name not in data:
+                return np.full(len(data), np.nan)
+            return data[name].to_numpy(np.float64)
+
+        sizes = {key: len(vocabularies[key]) for key in STORE_KEYS}
+        target = column('yield')
+
+        arrays = {}
+        for name in ['temperature', 'rainfall']:
+            values = column(name)
+            known = ~np.isnan(values)
+            arrays[f'climate_{name}'] = _mean_table(
+                values[known], codes['region'][known], codes['season'][known],
+                (sizes['region'], sizes['season'])
+            )
+        arrays['crop_yield'] = _mean_table(target, codes['crop'], codes['region'],
+                                           (sizes['crop'], sizes['region']))
+        # A table with an empty second key is just soil type and its marginal
+        arrays['soil_yield'] = _mean_table(target, codes['soil_type'], np.full(len(data), -1),
+                                           (sizes['soil_type'], 0))[:, 0]
+        return cls(vocabularies, arrays)
+
+    def save(self, path):
+        """
+        Write the store as a single .npz file
+        """
+        np.savez(path, **self.arrays, **{
+            f'vocab_{key}': np.array(values, dtype=str) for key, values in self.vocabularies.items()
+        })
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            vocabularies = {key: saved[f'vocab_{key}'].tolist() for key in STORE_KEYS}
+            arrays = {name: saved[name] for name in saved.files if not name.startswith('vocab_')}
+        return cls(vocabularies, arrays)
+
+    def _code(self, key, value):
+        # Unknown and missing keys map to the trailing marginal slot
+        if value is None:
+            return len(self.vocabularies[key])
+        return self.codes[key].get(_normalize(value), len(self.vocabularies[key]))
+
+    def _codes(self, key, values, n_rows):
+        if values is None:
+            return np.full(n_rows, len(self.vocabularies[key]))
+        # Resolve each distinct value once
+        uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        return np.array([self._code(key, value) for value in uniques], dtype=np.intp)[inverse.ravel()]
+
+    def _join(self, crop, region, season, soil_type):
+        return {
+            'region_temperature': self.arrays['climate_temperature'][region, season],
+            'region_rainfall': self.arrays['climate_rainfall'][region, season],
+            'crop_region_yield': self.arrays['crop_yield'][crop, region],
+            'soil_yield': self.arrays['soil_yield'][soil_type]
+        }
+
+    def lookup(self, values):
+        """
+        Return the store features for one request dict
+        """
+        return {name: float(value) for name, value in self._join(*(
+            self._code(key, values.get(key)) for key in STORE_KEYS
+        )).items()}
+
+    def lookup_columns(self, columns, n_rows):
+        """
+        Return the store features as arrays for per-field value sequences
+        """
+        return self._join(*(self._codes(key, columns.get(key), n_rows) for key in STORE_KEYS))
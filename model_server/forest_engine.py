@@ -0,0 +1,134 @@
+# Forest Inference Engine
+# This file flattens a trained random forest into contiguous NumPy arrays
+# and evaluates every tree for a batch with vectorized traversal, avoiding
+# the per-call and per-tree overhead of sklearn's predict.
+
+import numpy as np
+import os
+
+# Arrays that make up an exported forest
+ARRAY_NAMES = ['feature', 'threshold', 'children', 'is_leaf', 'value', 'roots']
+
+# Rows evaluated per traversal block; bounds the (n_trees, rows) work arrays
+BLOCK_SIZE = 4096
+
+def export_forest(model):
+    """
+    Flatten the trees of a fitted RandomForestRegressor into contiguous arrays
+
+    All trees share one node numbering. Children are stored as interleaved
+    (left, right) pairs; leaves point to themselves and are flagged in is_leaf.
+    """
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+
+    feature, threshold, children, is_leaf, value = [], [], [], [], []
+    for tree, offset in zip(trees, offsets):
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left == -1
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, 0.0, tree.threshold))
+        # Interleaved (left, right) pairs so one gather picks the branch
+        children.append(np.column_stack([
+            np.where(leaf, nodes, tree.children_left + offset),
+            np.where(leaf, nodes, tree.children_right + offset)
+        ]).ravel())
+        is_leaf.append(leaf)
+        value.append(tree.value[:, 0, 0])
+
+    return {
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'children': np.concatenate(children).astype(np.int32),
+        'is_leaf': np.concatenate(is_leaf),
+        'value': np.concatenate(value).astype(np.float64),
+        'roots': offsets.astype(np.int32),
+        'max_depth': int(max(tree.max_depth for tree in trees)),
+        'n_features': int(model.n_features_in_)
+    }
+
+def save_arrays(directory, arrays):
+    """
+    Write exported forest arrays as one .npy file each
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(directory, f'{name}.npy'), arrays[name])
+
+def load_arrays(directory, max_depth, n_features, mmap_mode='r'):
+    """
+    Open forest arrays saved with save_arrays, memory-mapped by default
+
+    Mapped read-only, the pages are shared between every process that
+    opens the same files.
+    """
+    arrays = {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in ARRAY_NAMES
+    }
+    arrays['max_depth'] = max_depth
+    arrays['n_features'] = n_features
+    return arrays
+
+class ForestEngine:
+    """
+    Vectorized evaluator for a forest exported with export_forest
+    """
+
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children = arrays['children']
+        self.is_leaf = arrays['is_leaf']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.max_depth = int(arrays['max_depth'])
+        self.n_features = int(arrays['n_features'])
+        self.n_trees = len(self.roots)
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(export_forest(model))
+
+    def _traverse(self, X):
+        # X is float32 like sklearn's trees; thresholds compare in float64.
+        # Walk the (tree, row) pairs still on internal nodes, dropping each
+        # pair once it reaches a leaf, so work tracks the real path lengths.
+        n_rows = X.shape[0]
+        X_flat = X.ravel()
+        node = np.repeat(self.roots, n_rows)
+        row_offsets = np.tile(np.arange(n_rows, dtype=np.int64) * self.n_features, self.n_trees)
+        active = np.flatnonzero(~self.is_leaf[node])
+
+        for _ in range(self.max_depth):
+            if not active.size:
+                break
+            current = node[active]
+            values = X_flat[row_offsets[active] + self.feature[current]]
+            go_right = ~(values <= self.threshold[current])
+            current = self.children[2 * current + go_right]
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+
+        return self.value[node].reshape(self.n_trees, n_rows)
+
+    def predict_trees(self, X):
+        """
+        Return per-tree predictions with shape (n_trees, n_samples)
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[0] <= BLOCK_SIZE:
+            return self._traverse(X)
+
+        return np.concatenate([
+            self._traverse(X[start:start + BLOCK_SIZE])
+            for start in range(0, X.shape[0], BLOCK_SIZE)
+        ], axis=1)
+
+    def predict(self, X):
+        """
+        Return the forest prediction (mean over trees) for each row of X
+        """
+        return self.predict_trees(X).sum(axis=0) / self.n_trees
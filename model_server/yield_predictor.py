@@ -4,16 +4,247 @@
 
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, KFold
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
+from datetime import datetime
+import threading
+import tempfile
+import shutil
 import pickle
+import json
+import time
 import os
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; training is then single-flight per process
+    fcntl = None
+
+from forest_engine import ForestEngine, export_forest, save_arrays, load_arrays
+from feature_store import FeatureStore, STORE_KEYS, STORE_FEATURES, TARGET_FEATURES
+
 # Define the path to save the trained model
 MODEL_PATH = 'model/yield_model.pkl'
 
-def load_data():
+# Memory-mappable copy of the model: one directory of .npy arrays per
+# version plus a manifest.json naming the current one
+ARRAYS_PATH = 'model/yield_model'
+
+# Artifact the servers load: 'pickle' (MODEL_PATH) or 'mmap' (ARRAYS_PATH)
+MODEL_FORMAT = os.environ.get('YIELD_MODEL_FORMAT', 'pickle')
+
+# Array versions kept on disk, so workers still mapping the previous one are safe
+ARRAY_VERSIONS_KEPT = 2
+
+# How often (in seconds) the registry re-checks the artifact for a new version
+RELOAD_CHECK_INTERVAL = float(os.environ.get('YIELD_MODEL_RELOAD_INTERVAL', 2.0))
+
+# Crop yield data used for training, streamed in chunks of CHUNK_SIZE rows
+DATA_PATH = os.environ.get(
+    'YIELD_DATA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crop-yield-data.csv')
+)
+CHUNK_SIZE = 100_000
+
+# Upper bound on rows held in memory for training (reservoir-sampled beyond this)
+MAX_TRAINING_ROWS = int(os.environ.get('YIELD_MAX_TRAINING_ROWS', 1_000_000))
+
+# CSV categorical columns and the feature names they are one-hot encoded under
+CATEGORICAL_COLUMNS = {'crop': 'crop', 'soilType': 'soil_type', 'season': 'season', 'region': 'region'}
+
+# Request fields that are one-hot encoded rather than used as numbers
+CATEGORICAL_FEATURES = set(CATEGORICAL_COLUMNS.values())
+
+# Numeric model inputs taken from the CSV (month/day_of_year derive from date)
+NUMERIC_COLUMNS = ['temperature', 'rainfall', 'month', 'day_of_year']
+
+# Lock file taken by the one process that trains when no artifact exists
+TRAINING_LOCK_PATH = MODEL_PATH + '.lock'
+
+# Seconds before background training is retried after a failure; doubles
+# with each consecutive failure up to TRAINING_RETRY_MAX
+TRAINING_RETRY_DELAY = float(os.environ.get('YIELD_TRAINING_RETRY_DELAY', 60))
+TRAINING_RETRY_MAX = float(os.environ.get('YIELD_TRAINING_RETRY_MAX', 3600))
+
+# Folds for the out-of-fold target encodings of training rows
+TARGET_ENCODING_FOLDS = 5
+
+# Largest batch scored with the array forest engine instead of sklearn
+ENGINE_MAX_BATCH = int(os.environ.get('YIELD_ENGINE_MAX_BATCH', 256))
+
+# Request fields a scenario sweep can vary, in grid order
+SCENARIO_FIELDS = [
+    'crop', 'region', 'season', 'soil_type',
+    'soil_quality', 'rainfall', 'temperature', 'area', 'fertilizer'
+]
+
+# Grid points scored per chunk of a scenario sweep; bounds memory per chunk
+SCENARIO_CHUNK_SIZE = int(os.environ.get('YIELD_SCENARIO_CHUNK_SIZE', 4096))
+
+# Largest scenario grid a single sweep may expand to
+MAX_SCENARIO_POINTS = int(os.environ.get('YIELD_MAX_SCENARIO_POINTS', 10_000_000))
+
+# Cheap per-crop baseline (kg/ha) served while no trained model is available
+BASE_YIELDS = {
+    'wheat': 4500, 'rice': 6000, 'corn': 3200,
+    'soybeans': 2800, 'cotton': 1500, 'sugarcane': 8000
+}
+
+def load_data(path=DATA_PATH, chunksize=CHUNK_SIZE, max_rows=MAX_TRAINING_ROWS, seed=42):
+    """
+    Load the crop yield data from CSV in chunks with compact dtypes
+
+    The file is streamed chunksize rows at a time. Numeric columns are kept
+    as float32 and categorical columns as integer codes into a vocabulary
+    shared across chunks. Rows are reservoir-sampled into at most max_rows
+    slots, so memory stays bounded however large the file is.
+    """
+    if not os.path.exists(path):
+        print(f"Warning: {path} not found. Training on synthetic data instead.")
+        return generate_synthetic_data()
+    
+    rng = np.random.default_rng(seed)
+    categorical = list(CATEGORICAL_COLUMNS.values())
+    vocabularies = {column: {} for column in categorical}
+    parts = []
+    reservoir = None
+    n_seen = 0
+    
+    reader = pd.read_csv(
+        path,
+        chunksize=chunksize,
+        usecols=list(CATEGORICAL_COLUMNS) + ['temperature', 'rainfall', 'expectedYield', 'date'],
+        dtype={**{column: 'category' for column in CATEGORICAL_COLUMNS},
+               'temperature': np.float32, 'rainfall': np.float32, 'expectedYield': np.float32}
+    )
+    for chunk in reader:
+        chunk = chunk.dropna(subset=['expectedYield'])
+        if chunk.empty:
+            continue
+        
+        # Encode the chunk into the compact column layout
+        dates = pd.to_datetime(chunk['date'], errors='coerce')
+        chunk_numeric = np.column_stack([
+            chunk['temperature'].to_numpy(np.float32),
+            chunk['rainfall'].to_numpy(np.float32),
+            dates.dt.month.to_numpy(np.float32, na_value=np.nan),
+            dates.dt.dayofyear.to_numpy(np.float32, na_value=np.nan)
+        ])
+        chunk_codes = np.column_stack([
+            _encode_categories(chunk[source], vocabularies[column])
+            for source, column in CATEGORICAL_COLUMNS.items()
+        ])
+        chunk_target = chunk['expectedYield'].to_numpy(np.float32)
+        
+        # Reservoir sampling: fill the free slots first, then replace at random
+        n_rows = len(chunk)
+        n_fill = 0
+        if reservoir is None:
+            n_fill = min(n_rows, max_rows - n_seen)
+            parts.append((chunk_numeric[:n_fill], chunk_codes[:n_fill], chunk_target[:n_fill]))
+            if n_seen + n_fill == max_rows:
+                reservoir = [np.concatenate(part) for part in zip(*parts)]
+                parts = None
+        if n_fill < n_rows:
+            positions = np.arange(n_seen + n_fill, n_seen + n_rows)
+            slots = rng.integers(0, positions + 1)
+            keep = slots < max_rows
+            for sample, values in zip(reservoir, (chunk_numeric, chunk_codes, chunk_target)):
+                sample[slots[keep]] = values[n_fill:][keep]
+        n_seen += n_rows
+    
+    if n_seen == 0:
+        raise ValueError(f"No training rows found in {path}")
+    if reservoir is None:
+        reservoir = [np.concatenate(part) for part in zip(*parts)]
+    numeric, codes, target = reservoir
+    
+    data = pd.DataFrame({
+        column: pd.Categorical.from_codes(codes[:, j], categories=list(vocabularies[column]))
+        for j, column in enumerate(categorical)
+    })
+    for j, column in enumerate(NUMERIC_COLUMNS):
+        data[column] = numeric[:, j]
+    data['yield'] = target
+    
+    # Rows without a parseable date get the column mean rather than a fake month
+    return data.fillna({column: data[column].mean() for column in NUMERIC_COLUMNS})
+
+def _encode_categories(series, vocabulary):
+    """
+    Map a categorical chunk column to codes in a vocabulary shared across chunks
+
+    Categories are stripped and lower-cased, the same normalization the
+    feature store and FeatureLayout apply to request values.
+    """
+    categories = series.cat.categories.str.strip().str.lower()
+    
+    mapping = np.array([vocabulary.setdefault(c, len(vocabulary)) for c in categories] + [-1], dtype=np.int32)
+    # Missing values have code -1, which indexes the trailing -1 in mapping
+    return mapping[series.cat.codes.to_numpy()]
+
+def feature_columns(frame):
+    """
+    Map a frame in the crop-yield-data.csv schema to FeatureLayout columns
+
+    Dates are expanded to month and day_of_year the same way load_data
+    encodes them for training; missing columns are simply left out.
+    """
+    columns = {
+        column: frame[source].to_numpy()
+        for source, column in CATEGORICAL_COLUMNS.items() if source in frame
+    }
+    for column in ['temperature', 'rainfall']:
+        if column in frame:
+            columns[column] = pd.to_numeric(frame[column], errors='coerce').to_numpy(np.float64)
+    if 'date' in frame:
+        dates = pd.to_datetime(frame['date'], errors='coerce')
+        columns['month'] = dates.dt.month.to_numpy(np.float64, na_value=np.nan)
+        columns['day_of_year'] = dates.dt.dayofyear.to_numpy(np.float64, na_value=np.nan)
+    return columns
+
+def add_store_features(data, store):
+    """
+    Join the feature store onto training rows as float32 columns
+    """
+    columns = {key: data[key].astype(object).to_numpy() for key in STORE_KEYS if key in data}
+    for name, values in store.lookup_columns(columns, len(data)).items():
+        data[name] = values.astype(np.float32)
+    return data
+
+def add_training_store_features(data, fit_rows=None, n_folds=TARGET_ENCODING_FOLDS, seed=42):
+    """
+    Build the feature store from fit_rows (all rows when None) and join it
+    onto data for training
+
+    The yield encodings of the fit rows are computed out-of-fold, from a
+    store built without the row's fold, so the forest never sees a feature
+    averaged over its own target. Other rows (held out for evaluation) and
+    the returned store, which ships with the model, use every fit row.
+    """
+    fit_rows = np.arange(len(data)) if fit_rows is None else np.asarray(fit_rows)
+    store = FeatureStore.build(data.iloc[fit_rows])
+    data = add_store_features(data, store)
+    
+    n_folds = min(n_folds, len(fit_rows))
+    if n_folds < 2:
+        return data, store
+    positions = {name: data.columns.get_loc(name) for name in TARGET_FEATURES}
+    for train, held in KFold(n_folds, shuffle=True, random_state=seed).split(fit_rows):
+        fold_store = FeatureStore.build(data.iloc[fit_rows[train]])
+        held_rows = data.iloc[fit_rows[held]]
+        columns = {key: held_rows[key].astype(object).to_numpy() for key in STORE_KEYS if key in data}
+        values = fold_store.lookup_columns(columns, len(held_rows))
+        for name in TARGET_FEATURES:
+            data.iloc[fit_rows[held], positions[name]] = values[name].astype(np.float32)
+    return data, store
+
+def generate_synthetic_data():
+    """
+    Generate random training data, used when no CSV data is available
+    """
     np.random.seed(42)
     n_samples = 1000
     
@@ -29,12 +260,16 @@ def load_data():
     
     return data
 
-def preprocess_data(data):
+def preprocess_data(data, fit_rows=None):
     """
     Preprocess the data for model training
+
+    The scaler is fit on fit_rows (positional indices) when given, so rows
+    held out for evaluation do not leak into it; all rows are transformed.
     """
-    # One-hot encode categorical variables
-    data_encoded = pd.get_dummies(data, columns=['crop'])
+    # One-hot encode categorical variables (float32 keeps the matrix compact)
+    categorical = [column for column in CATEGORICAL_COLUMNS.values() if column in data]
+    data_encoded = pd.get_dummies(data, columns=categorical, dtype=np.float32)
     
     # Split features and target
     X = data_encoded.drop('yield', axis=1)
@@ -42,7 +277,8 @@ def preprocess_data(data):
     
     # Scale features
     scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    scaler.fit(X if fit_rows is None else X.iloc[fit_rows])
+    X_scaled = scaler.transform(X)
     
     return X_scaled, y, scaler, X.columns
 
@@ -50,12 +286,16 @@ def train_model():
     """
     Train the yield prediction model
     """
-    # Load and preprocess data
     data = load_data()
-    X, y, scaler, feature_names = preprocess_data(data)
     
-    # Split into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Split into training and testing sets first: the region/crop/soil
+    # feature store and the scaler only see the training rows, so the
+    # test score is not inflated by yields they were built from
+    train_index, test_index = train_test_split(np.arange(len(data)), test_size=0.2, random_state=42)
+    data, store = add_training_store_features(data, fit_rows=train_index)
+    X, y, scaler, feature_names = preprocess_data(data, fit_rows=train_index)
+    X_train, X_test = X[train_index], X[test_index]
+    y_train, y_test = y.iloc[train_index], y.iloc[test_index]
     
     # Train a Random Forest model
     model = RandomForestRegressor(n_estimators=100, random_state=42)
@@ -68,50 +308,790 @@ def train_model():
     print(f"Model training score: {train_score:.4f}")
     print(f"Model testing score: {test_score:.4f}")
     
-    # Save the model and scaler
-    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-    with open(MODEL_PATH, 'wb') as f:
-        pickle.dump({'model': model, 'scaler': scaler, 'feature_names': feature_names}, f)
+    # Save the model and scaler, tagged with a version for the registry;
+    # the test split is kept as the validation set incremental retraining
+    # checks candidates against
+    save_artifact({
+        'model': model,
+        'scaler': scaler,
+        'feature_names': feature_names,
+        'feature_store': store,
+        'version': new_version()
+    }, validation=(X_test, y_test))
     
     return model, scaler, feature_names
 
-def predict_yield(crop, soil_quality, rainfall, temperature, area, fertilizer):
+# Last version handed out by new_version in this process
+_version_lock = threading.Lock()
+_last_version = None
+
+def new_version():
     """
-    Make a yield prediction for a given set of input parameters
+    Return a fresh artifact version: the UTC time to the microsecond
+
+    Prediction caches are keyed by version, so two publishes must never
+    share one; within a process a repeated timestamp is bumped forward.
+    """
+    global _last_version
+    with _version_lock:
+        now = datetime.utcnow()
+        version = now.strftime('%Y%m%d%H%M%S%f')
+        if _last_version is not None and version <= _last_version:
+            version = str(int(_last_version) + 1)
+        _last_version = version
+        return version
+
+def save_artifact(model_data, path=MODEL_PATH, validation=None):
+    """
+    Atomically publish a model artifact
+
+    The pickle is written to a temporary file in the same directory and
+    renamed over the target, so readers never see a partially written file.
+    Forests are also exported as memory-mappable arrays next to it.
+
+    validation is an (X, y) pair of scaled rows the model was not trained
+    on, kept next to the artifact for retrain_yield's acceptance check.
+    Without it any previous validation set is removed, since its rows may
+    be training data of the new model. Publishing a version that already
+    exists raises FileExistsError before anything is written.
+    """
+    forest = isinstance(model_data['model'], RandomForestRegressor)
+    if forest and os.path.exists(os.path.join(os.path.splitext(path)[0], model_data['version'])):
+        raise FileExistsError(f"Model version {model_data['version']} is already published")
+    _write_validation(validation, validation_path(path))
+    _write_pickle(model_data, path)
+    if forest:
+        export_arrays(model_data, os.path.splitext(path)[0])
+
+def validation_path(path=MODEL_PATH):
+    """
+    Path of the validation set published with the artifact at path
+    """
+    return os.path.splitext(path)[0] + '_validation.npz'
+
+def load_validation(path=MODEL_PATH):
+    """
+    Return the (X, y) validation set published with an artifact, or None
+    """
+    try:
+        with np.load(validation_path(path)) as saved:
+            return saved['X'], saved['y']
+    except FileNotFoundError:
+        return None
+
+def _write_validation(validation, path):
+    if validation is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.yield_validation-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            X, y = validation
+            np.savez(f, X=np.asarray(X, dtype=np.float32), y=np.asarray(y, dtype=np.float64))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_pickle(model_data, path):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.yield_model-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(model_data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file owner-only; keep the usual artifact permissions
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def export_arrays(model_data, directory=ARRAYS_PATH):
+    """
+    Publish a forest artifact as .npy arrays plus a small JSON manifest
+
+    The arrays go into a fresh <directory>/<version> folder and the manifest
+    is swapped in last with an atomic rename, so a reader either sees the
+    previous version or the complete new one. An existing version folder
+    is never overwritten: FileExistsError is raised instead.
+    """
+    version = model_data['version']
+    if os.path.exists(os.path.join(directory, version)):
+        raise FileExistsError(f"Model version {version} is already exported to {directory}")
+    feature_names = list(model_data['feature_names'])
+    arrays = export_forest(model_data['model'])
+    mean, scale = _scaler_arrays(model_data['scaler'], len(feature_names))
+    
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.tmp-')
+    try:
+        save_arrays(tmp_dir, arrays)
+        np.save(os.path.join(tmp_dir, 'scaler_mean.npy'), mean)
+        np.save(os.path.join(tmp_dir, 'scaler_scale.npy'), scale)
+        if model_data.get('feature_store') is not None:
+            model_data['feature_store'].save(os.path.join(tmp_dir, 'feature_store.npz'))
+        os.chmod(tmp_dir, 0o755)
+        
+        os.replace(tmp_dir, os.path.join(directory, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    
+    manifest = {
+        'version': version,
+        'arrays': version,
+        'feature_names': feature_names,
+        'max_depth': arrays['max_depth'],
+        'n_features': arrays['n_features'],
+        'n_trees': int(len(arrays['roots'])),
+        'feature_store': model_data.get('feature_store') is not None
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.manifest-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(directory, 'manifest.json'))
+    
+    # Drop older versions; unlinking files another worker still maps is safe
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith('.') and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-ARRAY_VERSIONS_KEPT]:
+        if name != version:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def _scaler_arrays(scaler, n_features):
+    """
+    Return the StandardScaler mean and scale as float64 arrays
+    """
+    mean = np.zeros(n_features) if scaler.mean_ is None else np.asarray(scaler.mean_, dtype=np.float64)
+    scale = np.ones(n_features) if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64)
+    return mean, scale
+
+class FeatureLayout:
+    """
+    Precompiled mapping from request inputs to the model's scaled feature row
+
+    Built once per loaded model: each feature name is mapped to its column
+    index and the StandardScaler mean/scale are kept as arrays, so a request
+    fills a reusable row buffer in place instead of going through pandas.
+    """
+
+    def __init__(self, feature_names, mean, scale, store=None):
+        self.feature_names = list(feature_names)
+        self.index = {name: i for i, name in enumerate(self.feature_names)}
+        self.mean = mean
+        self.scale = scale
+        
+        # Store features are joined from the request's crop/region/season/soil
+        # type; models trained without them skip the join
+        self.store = store if any(name in self.index for name in STORE_FEATURES) else None
+        
+        # One-hot columns default to 0; numeric inputs a request does not
+        # carry are imputed with their training mean (0 after scaling).
+        # Store features such as region_temperature share a categorical
+        # prefix but are numeric, so they are excluded by name
+        one_hot = np.array([
+            name not in STORE_FEATURES
+            and any(name.startswith(f'{column}_') for column in CATEGORICAL_COLUMNS.values())
+            for name in self.feature_names
+        ], dtype=bool)
+        self.numeric_names = [name for name, flag in zip(self.feature_names, one_hot) if not flag]
+        # Categories resolve only to one-hot columns. Models trained before
+        # categories were lower-cased keep their mixed-case one-hot names;
+        # they are also indexed under the normalized form
+        self.one_hot_index = {}
+        for i, (name, flag) in enumerate(zip(self.feature_names, one_hot)):
+            if flag:
+                self.one_hot_index[name] = i
+                self.one_hot_index.setdefault(name.lower(), i)
+        self.defaults = np.where(one_hot, 0.0, self.mean)
+        self._local = threading.local()
+
+    def _row_buffer(self):
+        # One preallocated row per thread (FastAPI runs sync routes in a pool)
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(self.feature_names)), dtype=np.float64)
+        return row
+
+    def _one_hot_index(self, column, value):
+        # Categories are matched case-insensitively, as _encode_categories
+        # normalizes them for training
+        return self.one_hot_index.get(f'{column}_{str(value).strip().lower()}')
+
+    def transform_one(self, values):
+        """
+        Fill and scale the feature row for one request
+
+        values holds numeric inputs by feature name plus the categorical
+        columns (crop, soil_type, season, region). Unknown inputs are ignored.
+        For a request that supplies every numeric feature this is exactly
+        reindex(fill_value=0) + scaler.transform.
+        """
+        row = self._row_buffer()
+        row[0] = self.defaults
+        for name, value in values.items():
+            if name in CATEGORICAL_FEATURES:
+                i = self._one_hot_index(name, value)
+                if i is not None:
+                    row[0, i] = 1.0
+                continue
+            
+            i = self.index.get(name)
+            if i is not None and value is not None:
+                row[0, i] = value
+        
+        if self.store is not None:
+            for name, value in self.store.lookup(values).items():
+                row[0, self.index[name]] = value
+        
+        np.subtract(row, self.mean, out=row)
+        np.divide(row, self.scale, out=row)
+        return row
+
+    def transform(self, rows):
+        """
+        Build and scale the feature matrix for a list of request dicts
+        """
+        names = dict.fromkeys(name for row in rows for name in row)
+        columns = {name: [row.get(name) for row in rows] for name in names}
+        return self.transform_columns(columns, len(rows))
+
+    def transform_columns(self, columns, n_rows):
+        """
+        Build and scale the feature matrix from per-field value sequences
+
+        columns maps request fields to n_rows values each; fields the model
+        does not use are ignored and missing numeric values are imputed.
+        """
+        X = np.tile(self.defaults, (n_rows, 1))
+        for name, values in columns.items():
+            if name in CATEGORICAL_FEATURES:
+                # Resolve each distinct category to its one-hot column once
+                uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+                index = np.array([self._one_hot_index(name, value) for value in uniques], dtype=float)
+                cols = index[inverse.ravel()]
+                hit = ~np.isnan(cols)
+                X[np.flatnonzero(hit), cols[hit].astype(np.intp)] = 1.0
+            elif name in self.index:
+                # Missing values are imputed like absent inputs
+                i = self.index[name]
+                values = np.asarray(values, dtype=np.float64)
+                X[:, i] = np.where(np.isnan(values), self.defaults[i], values)
+        
+        if self.store is not None:
+            for name, values in self.store.lookup_columns(columns, n_rows).items():
+                X[:, self.index[name]] = values
+        
+        X -= self.mean
+        X /= self.scale
+        return X
+
+class ModelRegistry:
+    """
+    Keeps the yield model resident in the process and swaps in a new
+    artifact when one is published to the model path
     """
-    # Load the model if it exists, otherwise train a new one
-    if os.path.exists(MODEL_PATH):
-        with open(MODEL_PATH, 'rb') as f:
+
+    def __init__(self, path=MODEL_PATH, check_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = None
+        self._last_check = 0.0
+
+    def _signature(self):
+        # mtime + size is enough to notice a re-published artifact
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, signature):
+        started = time.perf_counter()
+        if self.path.endswith('.json'):
+            state = self._load_arrays()
+        else:
+            state = self._load_pickle()
+        
+        state.setdefault('version', f"mtime-{signature[0] // 1_000_000_000}")
+        state['loaded_at'] = datetime.utcnow().isoformat()
+        state['load_seconds'] = time.perf_counter() - started
+        state['signature'] = signature
+        return state
+
+    def _load_pickle(self):
+        with open(self.path, 'rb') as f:
             model_data = pickle.load(f)
-            model = model_data['model']
-            scaler = model_data['scaler']
-            feature_names = model_data['feature_names']
-    else:
-        model, scaler, feature_names = train_model()
-    
-    # Prepare input data
-    input_data = pd.DataFrame({
-        'soil_quality': [soil_quality],
-        'rainfall': [rainfall],
-        'temperature': [temperature],
-        'area': [area],
-        'fertilizer': [fertilizer]
-    })
+        
+        feature_names = model_data['feature_names']
+        mean, scale = _scaler_arrays(model_data['scaler'], len(feature_names))
+        store = model_data.get('feature_store')
+        state = {
+            'model': model_data['model'],
+            'scaler': model_data['scaler'],
+            'feature_names': feature_names,
+            'layout': FeatureLayout(feature_names, mean, scale, store),
+            'engine': _build_engine(model_data['model'])
+        }
+        if 'version' in model_data:
+            state['version'] = model_data['version']
+        return state
+
+    def _load_arrays(self):
+        # Map the arrays read-only: pages are shared by every worker on the node
+        with open(self.path) as f:
+            manifest = json.load(f)
+        
+        directory = os.path.join(os.path.dirname(self.path), manifest['arrays'])
+        arrays = load_arrays(directory, manifest['max_depth'], manifest['n_features'])
+        mean = np.load(os.path.join(directory, 'scaler_mean.npy'), mmap_mode='r')
+        scale = np.load(os.path.join(directory, 'scaler_scale.npy'), mmap_mode='r')
+        store = FeatureStore.load(os.path.join(directory, 'feature_store.npz')) if manifest.get('feature_store') else None
+        return {
+            'model': None,
+            'scaler': None,
+            'feature_names': manifest['feature_names'],
+            'layout': FeatureLayout(manifest['feature_names'], mean, scale, store),
+            'engine': ForestEngine(arrays),
+            'version': manifest['version']
+        }
+
+    def get(self):
+        """
+        Return the loaded model state, reloading it if the artifact changed
+
+        Returns None while no artifact has been published yet.
+        """
+        state = self._state
+        if state is not None and time.monotonic() - self._last_check < self.check_interval:
+            return state
+        
+        # Only one thread checks/reloads; the others keep serving the current model
+        if not self._lock.acquire(blocking=state is None):
+            return state
+        try:
+            state = self._state
+            if not os.path.exists(self.path):
+                return state
+            
+            signature = self._signature()
+            if state is None or state['signature'] != signature:
+                # Build the new state fully before swapping the reference
+                state = self._load(signature)
+                self._state = state
+            self._last_check = time.monotonic()
+            return state
+        finally:
+            self._lock.release()
+
+    def info(self):
+        """
+        Describe the currently loaded model version
+        """
+        state = self._state
+        if state is None:
+            return {'loaded': False, 'path': self.path}
+        
+        return {
+            'loaded': True,
+            'path': self.path,
+            'version': state['version'],
+            'loaded_at': state['loaded_at'],
+            'load_seconds': round(state['load_seconds'], 6)
+        }
+
+def _build_engine(model):
+    """
+    Flatten a fitted random forest for the array engine (None for other models)
+    """
+    if not isinstance(model, RandomForestRegressor):
+        return None
+    return ForestEngine.from_model(model)
+
+def _predict_scaled(state, input_scaled):
+    """
+    Score a scaled feature matrix with the array engine, or the model itself
+
+    The engine wins on small batches where sklearn's per-call overhead
+    dominates; sklearn's compiled traversal is faster on large ones.
+    """
+    engine = state['engine']
+    if engine is not None and (state['model'] is None or len(input_scaled) <= ENGINE_MAX_BATCH):
+        return engine.predict(input_scaled)
+    return state['model'].predict(input_scaled)
+
+def score_columns(state, columns, n_rows):
+    """
+    Predict yields for FeatureLayout columns with an already loaded model state
+    """
+    return _predict_scaled(state, state['layout'].transform_columns(columns, n_rows))
+
+# Process-wide registry used by the prediction functions
+registry = ModelRegistry(
+    os.path.join(ARRAYS_PATH, 'manifest.json') if MODEL_FORMAT == 'mmap' else MODEL_PATH
+)
+
+def get_model_info():
+    """
+    Return the version and load time of the model serving predictions
+    """
+    return registry.info()
+
+def get_model_version():
+    """
+    Return the version of the model that will serve the next prediction
+
+    None while the baseline is being served. Goes through the registry, so
+    a newly published artifact is noticed even when callers skip predict_yield.
+    """
+    state = registry.get()
+    return None if state is None else state['version']
+
+# Single-flight background training state
+_training_lock = threading.Lock()
+_training_thread = None
+_training_error = None
+_training_failures = 0
+_training_retry_at = 0.0
+
+def _acquire_training_lock():
+    """
+    Take the cross-process training lock without blocking
+
+    The lock file next to MODEL_PATH is held by whichever worker process
+    trains, and records the last failure so every process honours its
+    backoff. Returns the open lock file, or None when another process is
+    training or a recorded failure is still backing off.
+    """
+    global _training_error, _training_failures, _training_retry_at
+    os.makedirs(os.path.dirname(TRAINING_LOCK_PATH) or '.', exist_ok=True)
+    lock_file = open(TRAINING_LOCK_PATH, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        lock_file.seek(0)
+        status = json.loads(lock_file.read() or '{}')
+    except (OSError, ValueError):
+        lock_file.close()
+        return None
     
-    # Add one-hot encoded crop columns
-    for crop_name in ['wheat', 'rice', 'corn', 'soybeans', 'cotton']:
-        input_data[f'crop_{crop_name}'] = 1 if crop == crop_name else 0
+    if status:
+        _training_error = status['error']
+        _training_failures = status['failures']
+        _training_retry_at = status['retry_at']
+        if time.time() < _training_retry_at:
+            lock_file.close()
+            return None
+    return lock_file
+
+def _training_elsewhere():
+    # Another process holds the training lock
+    if fcntl is None or not os.path.exists(TRAINING_LOCK_PATH):
+        return False
+    with open(TRAINING_LOCK_PATH) as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+    return False
+
+def _train_in_background(lock_file):
+    global _training_error, _training_failures, _training_retry_at
+    status = {}
+    try:
+        train_model()
+        _training_error = None
+        _training_failures = 0
+        registry.get()
+    except Exception as e:
+        # Back off before the next request may relaunch a failing job
+        _training_error = str(e)
+        _training_failures += 1
+        delay = TRAINING_RETRY_DELAY * 2 ** (_training_failures - 1)
+        _training_retry_at = time.time() + min(delay, TRAINING_RETRY_MAX)
+        status = {'error': _training_error, 'failures': _training_failures, 'retry_at': _training_retry_at}
+    finally:
+        lock_file.seek(0)
+        lock_file.truncate()
+        if status:
+            json.dump(status, lock_file)
+        lock_file.close()
+
+def start_background_training():
+    """
+    Train the model in a background thread if no artifact exists yet
+
+    Safe to call from every request, worker thread or worker process: at
+    most one training job runs per host (per process where fcntl is not
+    available), and the others keep polling the registry. After a failed
+    run, no new job starts until the retry backoff has passed.
+    """
+    global _training_thread
+    if os.path.exists(registry.path) or time.time() < _training_retry_at:
+        return None
     
-    # Ensure input data has all the required columns in the right order
-    input_data = input_data.reindex(columns=feature_names, fill_value=0)
+    with _training_lock:
+        if _training_thread is not None and _training_thread.is_alive():
+            return _training_thread
+        if os.path.exists(registry.path) or time.time() < _training_retry_at:
+            return None
+        lock_file = _acquire_training_lock()
+        if lock_file is None:
+            return None
+        # The artifact may have been published since the check above
+        if os.path.exists(registry.path):
+            lock_file.close()
+            return None
+        _training_thread = threading.Thread(target=_train_in_background, args=(lock_file,),
+                                            name='yield-model-training', daemon=True)
+        _training_thread.start()
+        return _training_thread
+
+def get_readiness():
+    """
+    Report whether a trained model is serving predictions
+
+    training is also true while another process holds the training lock.
+    After a failed training run, error holds its message, failures the
+    number of consecutive failures and retry_in the seconds until training
+    may be relaunched.
+    """
+    ready = registry.get() is not None
+    training = (_training_thread is not None and _training_thread.is_alive()) or (not ready and _training_elsewhere())
+    retry_in = max(0.0, _training_retry_at - time.time()) if _training_failures and not training else None
+    return {'ready': ready, 'training': training, 'error': _training_error,
+            'failures': _training_failures, 'retry_in': retry_in}
+
+def baseline_yield(crop):
+    """
+    Cheap per-crop yield estimate used until the trained model is ready
+    """
+    return float(BASE_YIELDS.get(crop, 4000))
+
+def predict_yield(crop, soil_quality, rainfall, temperature, area, fertilizer,
+                  region=None, season=None, soil_type=None, intervals=False):
+    """
+    Make a yield prediction for a given set of input parameters
+
+    region, season and soil_type are optional; they select the feature
+    store's climatology and historical yields for the request.
+
+    With intervals=True a dict with the point prediction ('yield') plus
+    p10/p50/p90 and std across the forest's trees is returned instead.
+    """
+    # Get the resident model; fall back to the baseline until it is trained
+    state = registry.get()
+    if state is None:
+        start_background_training()
+        predicted_yield = baseline_yield(crop)
+        return _baseline_interval(predicted_yield) if intervals else predicted_yield
     
-    # Scale the input data
-    input_scaled = scaler.transform(input_data)
+    # Fill the precompiled, pre-scaled feature row for this request
+    input_scaled = state['layout'].transform_one({
+        'crop': crop,
+        'region': region,
+        'season': season,
+        'soil_type': soil_type,
+        'soil_quality': soil_quality,
+        'rainfall': rainfall,
+        'temperature': temperature,
+        'area': area,
+        'fertilizer': fertilizer
+    })
+    
+    # Per-tree predictions come out of the same traversal as the point estimate
+    if intervals:
+        return _summarize_trees(_predict_trees(state, input_scaled))[0]
     
     # Make prediction
-    predicted_yield = model.predict(input_scaled)[0]
+    predicted_yield = _predict_scaled(state, input_scaled)[0]
     
     return predicted_yield
 
+def predict_yield_batch(rows, intervals=False):
+    """
+    Make yield predictions for a list of input parameter dicts in one pass
+
+    Each row has the same keys as the predict_yield arguments. All rows are
+    encoded into one feature matrix, scaled once and scored with a single
+    forest call; results are returned in input order. With intervals=True
+    each result is a dict as returned by predict_yield(..., intervals=True).
+    """
+    if not rows:
+        return []
+    
+    state = registry.get()
+    if state is None:
+        start_background_training()
+        predicted_yields = [baseline_yield(row['crop']) for row in rows]
+        return [_baseline_interval(y) for y in predicted_yields] if intervals else predicted_yields
+    
+    input_scaled = state['layout'].transform(rows)
+    if intervals:
+        return _summarize_trees(_predict_trees(state, input_scaled))
+    
+    predicted_yields = _predict_scaled(state, input_scaled)
+    
+    return predicted_yields.tolist()
+
+def _predict_trees(state, input_scaled):
+    """
+    Per-tree predictions with shape (n_trees, n_rows)
+    """
+    if state['engine'] is not None:
+        return state['engine'].predict_trees(input_scaled)
+    
+    input_scaled = np.asarray(input_scaled, dtype=np.float32)
+    return np.stack([tree.predict(input_scaled) for tree in state['model'].estimators_])
+
+def _summarize_trees(per_tree):
+    """
+    Point prediction and spread for each row from per-tree predictions
+    """
+    # Same sum-then-divide as the point prediction, so 'yield' is unchanged
+    predicted_yields = per_tree.sum(axis=0) / per_tree.shape[0]
+    p10, p50, p90 = np.percentile(per_tree, [10, 50, 90], axis=0)
+    std = per_tree.std(axis=0)
+    
+    return [
+        {'yield': float(y), 'p10': float(a), 'p50': float(b), 'p90': float(c), 'std': float(d)}
+        for y, a, b, c, d in zip(predicted_yields, p10, p50, p90, std)
+    ]
+
+def _baseline_interval(predicted_yield):
+    # The baseline carries no spread information
+    return {'yield': predicted_yield, 'p10': None, 'p50': None, 'p90': None, 'std': None}
+
+class RangeAxis:
+    """
+    Evenly spaced numeric sweep values, computed from grid positions on
+    demand so a range never materializes more than one chunk of values
+    """
+
+    def __init__(self, start, step, count, last=None):
+        self.start = start
+        self.step = step
+        self.count = count
+        # linspace ranges end exactly on stop
+        self.last = last
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, positions):
+        values = self.start + self.step * np.asarray(positions, dtype=np.float64)
+        if self.last is not None:
+            values = np.where(positions == self.count - 1, self.last, values)
+        return values
+
+def expand_axis(field, spec):
+    """
+    Return the values a scenario sweep takes for one field
+
+    spec is a single value, a list of values, or for numeric fields a range
+    given as {'start', 'stop', 'step'} (stop inclusive) or {'start', 'stop', 'num'};
+    a range must have exactly one of step and num and no other keys.
+    Lists become arrays; ranges become a RangeAxis whose length is known
+    before any value is generated.
+    """
+    categorical = field in CATEGORICAL_FEATURES
+    if isinstance(spec, dict):
+        if categorical:
+            raise ValueError(f"{field} takes a value or a list of values, not a range")
+        unknown = set(spec) - {'start', 'stop', 'step', 'num'}
+        if unknown:
+            raise ValueError(f"Unknown {field} range keys: {', '.join(sorted(unknown))}")
+        given = [key for key in ['step', 'num'] if spec.get(key) is not None]
+        if spec.get('start') is None or spec.get('stop') is None or len(given) != 1:
+            raise ValueError(f"{field} range needs start, stop and exactly one of step or num")
+        start, stop = float(spec['start']), float(spec['stop'])
+        if given == ['num']:
+            count, step = float(spec['num']), None
+        else:
+            step = float(spec['step'])
+            if not step > 0:
+                raise ValueError(f"{field} range step must be positive")
+            # Small tolerance so a stop that lands on the grid is included
+            count = np.floor((stop - start) / step + 1e-9) + 1
+        if not np.isfinite(count) or count > MAX_SCENARIO_POINTS:
+            raise ValueError(f"{field} sweeps more than {MAX_SCENARIO_POINTS} values")
+        count = max(int(count), 0)
+        if step is None:
+            values = RangeAxis(start, (stop - start) / (count - 1) if count > 1 else 0.0, count,
+                               last=stop if count > 1 else None)
+        else:
+            values = RangeAxis(start, step, count)
+    else:
+        values = np.asarray(spec if isinstance(spec, (list, tuple)) else [spec],
+                            dtype=str if categorical else np.float64)
+    
+    if len(values) == 0:
+        raise ValueError(f"{field} sweeps no values")
+    return values
+
+def predict_scenarios(spec, chunk_size=SCENARIO_CHUNK_SIZE, intervals=False):
+    """
+    Score the Cartesian grid of scenario values described by spec
+
+    spec maps SCENARIO_FIELDS to expand_axis specs; crop is required and
+    the grid is ordered with the last field varying fastest. The grid size
+    is checked against MAX_SCENARIO_POINTS before anything is allocated.
+    Returns the number of grid points and a generator that yields one list of results
+    per chunk: each result holds the point's inputs plus 'yield' (and the
+    interval fields with intervals=True). The grid is expanded lazily, so
+    only one chunk of points and features is in memory at a time.
+    """
+    unknown = set(spec) - set(SCENARIO_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {', '.join(sorted(unknown))}")
+    if spec.get('crop') is None:
+        raise ValueError("crop is required")
+    
+    axes = {
+        field: expand_axis(field, spec[field])
+        for field in SCENARIO_FIELDS if spec.get(field) is not None
+    }
+    n_points = int(np.prod([len(values) for values in axes.values()], dtype=object))
+    if n_points > MAX_SCENARIO_POINTS:
+        raise ValueError(f"Scenario grid has {n_points} points; the limit is {MAX_SCENARIO_POINTS}")
+    
+    return n_points, _score_scenarios(axes, n_points, max(int(chunk_size), 1), intervals)
+
+def _score_scenarios(axes, n_points, chunk_size, intervals):
+    # One model for the whole sweep, even if a new artifact lands mid-stream
+    state = registry.get()
+    if state is None:
+        start_background_training()
+    names = list(axes)
+    shape = tuple(len(axes[name]) for name in names)
+    
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        positions = np.unravel_index(np.arange(start, stop), shape)
+        columns = {name: axes[name][position] for name, position in zip(names, positions)}
+        
+        if state is None:
+            predicted_yields = [baseline_yield(crop) for crop in columns['crop'].tolist()]
+            results = [_baseline_interval(y) if intervals else {'yield': y} for y in predicted_yields]
+        else:
+            input_scaled = state['layout'].transform_columns(columns, stop - start)
+            if intervals:
+                results = _summarize_trees(_predict_trees(state, input_scaled))
+            else:
+                results = [{'yield': y} for y in _predict_scaled(state, input_scaled).tolist()]
+        
+        inputs = zip(*(columns[name].tolist() for name in names))
+        yield [{**dict(zip(names, values)), **result} for values, result in zip(inputs, results)]
+
 if __name__ == "__main__":
     train_model()
@@ -1,72 +1,143 @@
+import argparse
+import json
 import os
+import sys
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+from tensorflow.keras.models import Model, Sequential
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Input
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_models"))
+from disease_detection import list_images, make_dataset, make_augmentation, decode_image
+from bottleneck_cache import BottleneckCache
+
 # Paths
 train_dir = "image_dataset/train"
 test_dir = "image_dataset/test"
+feature_cache_dir = "image_dataset/.bottleneck_cache"
 
 # Image Preprocessing
-img_size = (224, 224)
 batch_size = 32
 
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=20,
-    zoom_range=0.2,
-    horizontal_flip=True
-)
-
-test_datagen = ImageDataGenerator(rescale=1./255)
-
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=img_size,
-    batch_size=batch_size,
-    class_mode='categorical'
-)
-
-test_generator = test_datagen.flow_from_directory(
-    test_dir,
-    target_size=img_size,
-    batch_size=batch_size,
-    class_mode='categorical'
-)
-
-# Model Architecture
-base_model = MobileNetV2(include_top=False, input_shape=(224, 224, 3), weights='imagenet')
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = Dense(128, activation='relu')(x)
-predictions = Dense(train_generator.num_classes, activation='softmax')(x)
-
-model = Model(inputs=base_model.input, outputs=predictions)
-
-# Freeze base layers
-for layer in base_model.layers:
-    layer.trainable = False
-
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-
-# Callbacks
-checkpoint = ModelCheckpoint("plant_disease_model.h5", save_best_only=True)
-early_stop = EarlyStopping(patience=3, restore_best_weights=True)
-
-# Training
-model.fit(
-    train_generator,
-    validation_data=test_generator,
-    epochs=10,
-    callbacks=[checkpoint, early_stop]
-)
-
-# Save class indices
-import json
-with open("class_indices.json", "w") as f:
-    json.dump(train_generator.class_indices, f)
+# Pooled MobileNetV2 output size, and the cache key for its features
+feature_dim = 1280
+feature_key = "MobileNetV2-imagenet-224-avg-rescale255"
+
+def build_backbone():
+    # Frozen ImageNet MobileNetV2 with global average pooling
+    base_model = MobileNetV2(include_top=False, input_shape=(224, 224, 3), weights='imagenet')
+    for layer in base_model.layers:
+        layer.trainable = False
+    return base_model
+
+def build_head(num_classes):
+    # Classifier trained on top of the pooled backbone features
+    return Sequential([
+        Input(shape=(feature_dim,)),
+        Dense(128, activation='relu'),
+        Dense(num_classes, activation='softmax')
+    ])
+
+def train_end_to_end(class_names, train_images, test_images, epochs):
+    # tf.data pipelines: files are listed once, decoded and augmented in
+    # parallel and prefetched; decoded test images are cached after epoch 1
+    train_dataset = make_dataset(
+        train_images,
+        class_names,
+        batch_size=batch_size,
+        augmentation=make_augmentation(rotation_range=20, shift_range=0, zoom_range=0.2),
+        shuffle=True
+    )
+    test_dataset = make_dataset(test_images, class_names, batch_size=batch_size, cache='')
+
+    # Model Architecture
+    base_model = build_backbone()
+    x = GlobalAveragePooling2D()(base_model.output)
+    predictions = build_head(len(class_names))(x)
+    model = Model(inputs=base_model.input, outputs=predictions)
+
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    # Callbacks
+    checkpoint = ModelCheckpoint("plant_disease_model.h5", save_best_only=True)
+    early_stop = EarlyStopping(patience=3, restore_best_weights=True)
+
+    # Training
+    model.fit(
+        train_dataset,
+        validation_data=test_dataset,
+        epochs=epochs,
+        callbacks=[checkpoint, early_stop]
+    )
+    return model
+
+def train_cached_features(class_names, train_images, test_images, epochs):
+    # The frozen backbone runs once per new or changed image; its pooled
+    # features are read back from the cache on every later run, so only
+    # the small head is trained. Augmentation is skipped: it would change
+    # the backbone input on every epoch.
+    base_model = build_backbone()
+    backbone = Model(inputs=base_model.input, outputs=GlobalAveragePooling2D()(base_model.output))
+    cache = BottleneckCache(feature_cache_dir, feature_dim, feature_key)
+
+    def extract(paths):
+        dataset = tf.data.Dataset.from_tensor_slices(paths)
+        dataset = dataset.map(decode_image, num_parallel_calls=tf.data.AUTOTUNE)
+        for batch in dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE):
+            yield backbone(batch, training=False).numpy()
+
+    def load(images):
+        features, computed = cache.features_for([path for path, _ in images], extract)
+        labels = tf.keras.utils.to_categorical(
+            [class_names.index(class_name) for _, class_name in images], len(class_names)
+        )
+        print(f"{len(images)} images: {computed} ran through the backbone, {len(images) - computed} cached")
+        return features, labels
+
+    train_features, train_labels = load(train_images)
+    test_features, test_labels = load(test_images)
+
+    head = build_head(len(class_names))
+    head.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    head.fit(
+        train_features,
+        train_labels,
+        validation_data=(test_features, test_labels),
+        batch_size=batch_size,
+        epochs=epochs,
+        shuffle=True,
+        callbacks=[EarlyStopping(patience=3, restore_best_weights=True)]
+    )
+
+    # Same architecture as end-to-end training, so serving is unchanged
+    model = Model(inputs=base_model.input, outputs=head(backbone.output))
+    model.save("plant_disease_model.h5")
+    return model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the MobileNetV2 plant disease classifier")
+    parser.add_argument("--cached-features", action="store_true",
+                        help="train only the head on cached backbone features")
+    parser.add_argument("--epochs", type=int, default=10)
+    args = parser.parse_args()
+
+    train_images = list_images(train_dir)
+    test_images = list_images(test_dir)
+    class_names = sorted({class_name for _, class_name in train_images})
+
+    # Labels come from the train classes; a test-only class has no output unit
+    test_only = sorted({class_name for _, class_name in test_images} - set(class_names))
+    if test_only:
+        parser.error(f"{test_dir} has classes missing from {train_dir}: {', '.join(test_only)}")
+
+    if args.cached_features:
+        train_cached_features(class_names, train_images, test_images, args.epochs)
+    else:
+        train_end_to_end(class_names, train_images, test_images, args.epochs)
+
+    # Save class indices
+    with open("class_indices.json", "w") as f:
+        json.dump({name: index for index, name in enumerate(class_names)}, f)
 
-print("✅ Model trained and saved as plant_disease_model.h5")
+    print("✅ Model trained and saved as plant_disease_model.h5")